@@ -1,15 +1,14 @@
 #!/usr/bin/env python
 """
-buildMC makes building projects with CMake or Meson + Ninja even simpler.
+buildMC makes building projects with CMake, Meson + Ninja or GNU Make even simpler.
 It facilitates easy testing across operating systems and compiler vendors.
 Michael Hirsch, Ph.D.
 
 ## Intel
 
-The Intel compiler environment must be configured before running build.py:
-
-* Windows: compilervars.bat intel64
-* Linux / Mac: source compilervars.sh intel64
+If the Intel compiler environment is not already configured, buildmc runs the oneAPI setvars
+or classic compilervars script from its default install location, or as given by "intel_env"
+in buildmc.ini, and caches the resulting environment until the script changes.
 
 ## compiler hints
 
@@ -18,35 +17,91 @@ can specify a main compiler vendor.
 Example:
 
     buildmc ~/my_project -v intel
+
+## build history
+
+Each build is recorded in a local database. Show build time trends and builds slower than usual by:
+
+    buildmc stats
+
+## many projects
+
+Build the projects listed in a manifest in dependency order, in parallel where possible:
+
+    buildmc batch manifest.ini
+
+## disk space
+
+Remove the least recently used build directories, until those buildmc configured use at most 200 GB:
+
+    buildmc gc -max_size 200G
 """
 from pathlib import Path
 from argparse import ArgumentParser
 import logging
+import sys
 import buildmc
+import buildmc.history
+import buildmc.batch
+import buildmc.registry
+import buildmc.jobs
 
 
 def main():
+    if sys.argv[1:2] == ['stats']:
+        stats(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ['batch']:
+        batch(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ['gc']:
+        gc(sys.argv[2:])
+        return
+
     p = ArgumentParser()
     p.add_argument('source_dir', help='path to source directory', nargs='?', default=Path.cwd())
     p.add_argument('-v', '--vendor', help='compiler vendor [clang, clang-cl, gnu, intel, msvc, pgi]')
     p.add_argument('-b', '--build_dir', help='path to build directory')
     p.add_argument('-wipe', help='wipe and rebuild from scratch', action='store_true')
-    p.add_argument('-s', '--buildsys', help='default build system')
+    p.add_argument('-s', '--buildsys', help='default build system [cmake, meson, make]')
     p.add_argument('-cfg', help='path to buildmc.ini file')
     p.add_argument('-args', help='preprocessor arguments', nargs='+', default=[])
-    p.add_argument('-debug', help='debug (-O0) instead of release (-O3) build', action='store_true')
+    p.add_argument('-debug', help='debug (-O0) instead of release (-O3) build, same as "-profile debug"',
+                   action='store_true')
+    p.add_argument('-profile', help='build profile [release, native, lto, debug] or [profile.<name>] in buildmc.ini')
     p.add_argument('-test', help='run project self-test, if available', action='store_true')
     p.add_argument('-install', help='specify full install directory e.g. ~/libs_gcc/mylib')
     p.add_argument('-msvc', help='desired MSVC')
+    p.add_argument('-unity', help='unity (jumbo) build', action='store_true')
+    p.add_argument('-unity_tune', help='time clean builds over unity batch sizes, saving the fastest to buildmc.ini',
+                   action='store_true')
+    p.add_argument('-pgo', help='profile-guided optimization: instrumented build, train with project tests, optimized build',
+                   action='store_true')
+    p.add_argument('-quiet', help='show build output only for failed commands', action='store_true')
+    p.add_argument('-log_dir', help='save full build output, compressed, in this directory')
+    p.add_argument('-mem', help='memory budget for parallel compiles e.g. 16G, or "auto" for available memory')
+    p.add_argument('-j', help='maximum parallel jobs', type=int)
+    p.add_argument('-changed_since', help='build and test only targets affected by files changed since this Git ref',
+                   metavar='REF')
+    p.add_argument('-linker', help='linker: auto (fastest available, the default), default (compiler default), '
+                   'mold, lld, gold')
+    p.add_argument('-linker_compare', help='time links with each available linker, saving the fastest to buildmc.ini',
+                   action='store_true')
+    p.add_argument('-profile_compile', help='report compile time of each file, header and template, '
+                   'from a clean build in build_dir/profile-compile', action='store_true')
+    p.add_argument('-sample', help='seconds between samples of CPU, memory and I/O use of the build, 0 to disable',
+                   type=float, default=0.5)
+    p.add_argument('-ramdisk', help='build directory in RAM disk (/dev/shm or "ramdisk" of buildmc.ini)',
+                   action='store_true')
     a = p.parse_args()
 
     logging.basicConfig(format='%(asctime)s %(levelname)s %(message)s',
                         datefmt='%H:%M:%S',
                         level=logging.INFO)
 
-    args = a.args
+    profile = a.profile
     if a.debug:
-        args.append('-DCMAKE_BUILD_TYPE=Debug')
+        profile = 'debug'
 
     params = {'source_dir': a.source_dir,
               'build_dir': a.build_dir,
@@ -55,9 +110,84 @@ def main():
               'msvc_cmake': a.msvc,
               'install_dir': a.install,
               'do_test': a.test,
-              'config_fn': a.cfg}
+              'config_fn': a.cfg,
+              'memory_budget': a.mem,
+              'jobs': a.j,
+              'changed_since': a.changed_since,
+              'ramdisk': a.ramdisk,
+              'linker': a.linker,
+              'linker_compare': a.linker_compare,
+              'profile_compile': a.profile_compile,
+              'sample_interval': a.sample,
+              'unity': a.unity,
+              'unity_tune': a.unity_tune,
+              'pgo': a.pgo,
+              'profile': profile,
+              'quiet': a.quiet,
+              'log_dir': a.log_dir}
+
+    buildmc.do_build(params, a.args, wipe=a.wipe)
+
+
+def stats(argv):
+    p = ArgumentParser(prog='buildmc stats', description='build time history, flagging slower builds')
+    p.add_argument('source_dir', help='only show builds of this source directory', nargs='?')
+    p.add_argument('-n', help='number of recent builds to show', type=int, default=30)
+    p.add_argument('-window', help='number of previous builds for baseline time', type=int, default=10)
+    p.add_argument('-threshold', help='flag builds this fraction slower than baseline', type=float, default=0.2)
+    a = p.parse_args(argv)
+
+    runs = buildmc.history.get_runs(a.source_dir, limit=a.n + a.window)
+    buildmc.history.flag_regressions(runs, a.window, a.threshold)
+    buildmc.history.print_stats(runs[-a.n:])
+
+
+def batch(argv):
+    p = ArgumentParser(prog='buildmc batch', description='build projects of a manifest in dependency order')
+    p.add_argument('manifest', help='.ini file with a section per project')
+    p.add_argument('-j', help='CPU cores shared by all builds (default: all)', type=int)
+    p.add_argument('-force', help='build even projects unchanged since their last build', action='store_true')
+    p.add_argument('-log_dir', help='save full build output of each project, compressed, in this directory')
+    p.add_argument('-verbose', help='show build output of each project, not only of failed commands',
+                   action='store_true')
+    a = p.parse_args(argv)
+
+    logging.basicConfig(format='%(asctime)s %(levelname)s %(message)s',
+                        datefmt='%H:%M:%S',
+                        level=logging.INFO)
+
+    projects = buildmc.batch.read_manifest(a.manifest)
+    opts = {'quiet': not a.verbose, 'log_dir': a.log_dir}
+
+    status = buildmc.batch.build_all(projects, a.j,
+                                     build=lambda n, P, j: buildmc.batch.build_project(n, P, j, **opts),
+                                     state_fn=buildmc.batch.get_state_fn(a.manifest), force=a.force)
+
+    for name, s in status.items():
+        print(f'{name:<20} {s}')
+
+    if any(s in ('failed', 'blocked') for s in status.values()):
+        raise SystemExit(1)
+
+
+def gc(argv):
+    p = ArgumentParser(prog='buildmc gc', description='list build directories, removing least recently used ones')
+    p.add_argument('-max_size', help='total size to keep e.g. 200G')
+    p.add_argument('-dry_run', help='only show what would be removed', action='store_true')
+    a = p.parse_args(argv)
+
+    logging.basicConfig(format='%(asctime)s %(levelname)s %(message)s',
+                        datefmt='%H:%M:%S',
+                        level=logging.INFO)
+
+    if not a.max_size:
+        buildmc.registry.print_dirs(buildmc.registry.get_dirs())
+        return
 
-    buildmc.do_build(params, args, wipe=a.wipe)
+    evict = buildmc.registry.gc(buildmc.jobs.parse_size(a.max_size), dry_run=a.dry_run)
+    if a.dry_run:
+        print('would remove:')
+        buildmc.registry.print_dirs(evict)
 
 
 if __name__ == '__main__':
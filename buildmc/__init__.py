@@ -1,24 +1,151 @@
 from pathlib import Path
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Union
+import logging
+import threading
+import shutil
+import time
 
 from .cmake import Cmake
 from .mesonbuild import Meson
+from .gnumake import Make
+from .compilers import pgo_vendor, pgo_flags, add_flags, gcc_major
+from . import unity
+from . import linker
+from . import compileprof
+from . import pgo
+from . import history
+from . import sampler
+from . import registry
+
+# Builder subclasses for each build system
+Backend = Union[Cmake, Meson, Make]
 
 
 def do_build(params: Dict[str, Any],
              args: List[str] = [],
              wipe: bool = False):
     """
-    attempts build with Meson or CMake
+    attempts build with Meson, CMake or GNU Make
+    """
+    if params.get('pgo'):
+        do_pgo(params, args, wipe)
+        return
+
+    B = get_builder(params, args)
+
+    if params.get('unity_tune'):
+        unity.tune(B)
+
+    if params.get('linker_compare'):
+        linker.compare(B)
+
+    if B.profile_compile:
+        # every file is compiled, in the build directory used only for profiling
+        shutil.rmtree(B.build_dir, ignore_errors=True)
+        tic = time.time()
+        run(B, True, params.get('history_db'))
+        compileprof.report(B.build_dir, tic)
+        return
+
+    run(B, wipe, params.get('history_db'))
+
+
+def run(B: Backend, wipe: bool = False, history_db: Path = None):
+    """
+    build, recording the run and build directory in the build history database and sampling resource use
+    """
+    status = 'fail'
+    S = None
+    if B.sample_interval and sampler.Sampler.available():
+        S = sampler.Sampler(B.sample_interval, lambda: B.current_phase)
+        S.start()
+    rss0 = history.peak_rss()
+
+    # earlier configures of B e.g. by unity.tune are not part of this build
+    B.timings = {}
+    B.wipe_reason = ''
+    tic = time.monotonic()
+    try:
+        B.config(wipe)
+        status = 'ok'
+    finally:
+        peak_rss = None
+        if S:
+            S.stop()
+            if B.build_dir.is_dir():
+                S.write(B.build_dir / sampler.TIMELINE_NAME)
+            summary = sampler.summarize(S.samples)
+            sampler.print_summary(summary)
+            peak_rss = summary.get('peak_rss')
+        elif threading.current_thread() is threading.main_thread():
+            # the maximum over all builds of this process: only known to be this build's if it rose
+            rss = history.peak_rss()
+            if rss and rss != rss0:
+                peak_rss = rss
+        B.sync_ramdisk()
+        history.record(B, status, time.monotonic() - tic, history_db, peak_rss)
+        if B.build_dir.is_dir():
+            registry.register(B, history_db)
+
+
+def do_pgo(params: Dict[str, Any], args: List[str] = [], wipe: bool = False):
+    """
+    profile-guided optimization:
+
+    1. instrumented build in build_dir/pgo-generate, running the project tests as training workload
+    2. optimized build in build_dir/pgo-use with the merged profile
+
+    step 1 is skipped if a profile is cached for the current source files.
+    GCC < 11 cannot apply a profile made in another build directory, so both steps build in build_dir/pgo.
+    Both builds use the release build profile unless another is given, as profiles are for optimized code.
     """
+    params = dict(params, profile=params.get('profile') or 'release')
+    B = get_builder(params, args)
+    vendor = pgo_vendor(B.compiler)
+    # with a build profile, Builder appends the profile name to the given build_dir
+    build_dir = B.persist_dir or B.build_dir
+    base_dir = build_dir.parent if B.profile else build_dir
+
+    pgo_profile = pgo.get_profile(B.source_dir, base_dir, vendor, {'compiler': B.compiler, 'args': B.args})
+
+    shared = vendor == 'gnu' and gcc_major(B.compiler['CC'], B.get_env()) < 11
+    if shared:
+        logging.info('PGO: GCC < 11, instrumented and optimized builds share a build directory')
+
+    U = get_builder(dict(params, build_dir=base_dir / ('pgo' if shared else 'pgo-use')), args)
+    # build systems read compiler flags only on first configure
+    stamp = U.build_dir / 'buildmc_pgo_profile.txt'
+
+    if wipe or not pgo_profile.exists():
+        logging.info(f'PGO: instrumented build and training run for {pgo_profile}')
+        G = get_builder(dict(params, build_dir=base_dir / ('pgo' if shared else 'pgo-generate'),
+                             do_test=True, install_dir=None), args)
+        raw_dir = G.build_dir / 'pgo-raw'
+        shutil.rmtree(raw_dir, ignore_errors=True)
+        if shared and stamp.is_file():
+            stamp.unlink()
+        add_flags(G.compiler, pgo_flags(vendor, 'generate', raw_dir, None if shared else G.build_dir))
+        run(G, True, params.get('history_db'))
+        pgo.merge(vendor, raw_dir, pgo_profile, G.compiler['CC'], G.get_env())
+
+    add_flags(U.compiler, pgo_flags(vendor, 'use', pgo_profile, None if shared else U.build_dir))
+    wipe = wipe or not stamp.is_file() or stamp.read_text() != str(pgo_profile)
+
+    logging.info(f'PGO: optimized build in {U.build_dir}')
+    run(U, wipe, params.get('history_db'))
+    stamp.write_text(str(pgo_profile))
+
+
+def get_builder(params: Dict[str, Any], args: List[str] = []) -> Backend:
+
     build_system = get_buildsystem(params['build_system'], params['source_dir'])
 
     if build_system == 'meson':
-        M = Meson(params)
-        M.config(wipe)
+        return Meson(params, args)
     elif build_system == 'cmake':
-        C = Cmake(params)
-        C.config(wipe)
+        return Cmake(params, args)
+    elif build_system == 'make':
+        return Make(params, args)
     else:
         raise ValueError(f'I do not know about build_system {build_system}')
 
@@ -37,8 +164,10 @@ def find_buildfile(source_dir: Path) -> str:
         return 'cmake'
     elif (source_dir / 'meson.build').is_file():
         return 'meson'
+    elif (source_dir / 'Makefile').is_file():
+        return 'make'
 
-    raise FileNotFoundError(f'could not find build system file (CMakeLists.txt or meson.build) in {source_dir}')
+    raise FileNotFoundError(f'could not find build system file (CMakeLists.txt, meson.build or Makefile) in {source_dir}')
 
 
 def get_buildsystem(build_system: Path, source_dir: Path) -> str:
@@ -0,0 +1,204 @@
+"""
+build many interdependent projects listed in a manifest file, e.g.
+
+    [DEFAULT]
+    vendor: gcc
+
+    [lapack]
+    source_dir: ~/src/lapack
+    install_dir: ~/libs_gcc/lapack
+
+    [solver]
+    source_dir: ~/src/solver
+    install_dir: ~/libs_gcc/solver
+    args: -Dfull=on
+
+A project depends on another if a library root in its buildmc.ini "library:" list is within the
+other project's install_dir. Independent projects build in parallel, sharing a budget of CPU cores,
+and each project starts as soon as the projects it depends on are installed.
+Projects whose inputs are unchanged since their last successful build are skipped.
+"""
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Set
+from configparser import ConfigParser
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import logging
+import hashlib
+import json
+import os
+
+from . import config
+from .fingerprint import source_fingerprint
+
+Project = Dict[str, Any]
+
+
+def read_manifest(fn: Path) -> Dict[str, Project]:
+
+    fn = Path(fn).expanduser()
+    if not fn.is_file():
+        raise FileNotFoundError(fn)
+
+    C = ConfigParser()
+    C.read(fn)
+
+    projects = {}
+    for name in C.sections():
+        S = C[name]
+        if not S.get('source_dir'):
+            raise ValueError(f'{fn} [{name}] needs source_dir')
+        projects[name] = {'source_dir': Path(S['source_dir']).expanduser().resolve(),
+                          'build_dir': S.get('build_dir'),
+                          'config_fn': S.get('cfg'),
+                          'install_dir': S.get('install_dir'),
+                          'vendor': S.get('vendor'),
+                          'build_system': S.get('build_system'),
+                          'do_test': S.getboolean('test', fallback=False),
+                          'args': S.get('args', '').split()}
+
+    return projects
+
+
+def get_deps(projects: Dict[str, Project]) -> Dict[str, Set[str]]:
+    """
+    prerequisites of each project, from the library roots in the buildmc.ini of each project
+    """
+    installs = {name: Path(p['install_dir']).expanduser().resolve()
+                for name, p in projects.items() if p.get('install_dir')}
+
+    deps: Dict[str, Set[str]] = {}
+    for name, p in projects.items():
+        deps[name] = set()
+        for lib, lib_dir in config.get_library(p.get('config_fn') or p['source_dir']).items():
+            if len(lib_dir) != 1:
+                continue
+            root = Path(lib_dir[0]).expanduser().resolve()
+            for other, prefix in installs.items():
+                if other != name and (root == prefix or prefix in root.parents):
+                    deps[name].add(other)
+
+    check_cycles(deps)
+
+    return deps
+
+
+def check_cycles(deps: Dict[str, Set[str]]):
+
+    done: Set[str] = set()
+    while len(done) < len(deps):
+        ready = [n for n in deps if n not in done and deps[n] <= done]
+        if not ready:
+            raise ValueError(f'dependency cycle among {sorted(set(deps) - done)}')
+        done.update(ready)
+
+
+def get_fingerprint(project: Project, dep_fingerprints: List[str]) -> str:
+    """
+    changes when the project sources, build settings or prerequisites change
+    """
+    build_dir = project.get('build_dir') or project['source_dir'] / 'build'
+
+    h = hashlib.sha256(source_fingerprint(project['source_dir'], exclude=build_dir).encode())
+    h.update(json.dumps(project, sort_keys=True, default=str).encode())
+    for fp in sorted(dep_fingerprints):
+        h.update(fp.encode())
+
+    return h.hexdigest()[:16]
+
+
+def build_all(projects: Dict[str, Project], cores: int = None,
+              build: Callable[[str, Project, int], None] = None,
+              state_fn: Path = None, force: bool = False) -> Dict[str, str]:
+    """
+    build projects in dependency order, in parallel where possible.
+
+    cores: total CPU cores shared by concurrent builds
+    build: function(name, project, jobs) building one project, raising on failure
+    state_fn: JSON file of fingerprints of successful builds, to skip unchanged projects
+
+    Returns status of each project: built, unchanged, failed or blocked (a prerequisite failed)
+    """
+    if not cores:
+        cores = os.cpu_count() or 1
+    if build is None:
+        build = build_project
+
+    deps = get_deps(projects)
+
+    state: Dict[str, str] = {}
+    if state_fn and state_fn.is_file():
+        state = json.loads(state_fn.read_text())
+
+    status: Dict[str, str] = {}
+    fingerprints: Dict[str, str] = {}
+    running: Dict[Any, tuple] = {}
+    free = cores
+
+    with ThreadPoolExecutor(max_workers=len(projects) or 1) as pool:
+        while len(status) < len(projects):
+            pending = [n for n in projects if n not in status and n not in fingerprints]
+
+            for n in pending:
+                if any(status.get(d) in ('failed', 'blocked') for d in deps[n]):
+                    logging.error(f'{n}: not built since prerequisite failed')
+                    status[n] = 'blocked'
+
+            ready = [n for n in pending if n not in status and
+                     all(status.get(d) in ('built', 'unchanged') for d in deps[n])]
+
+            to_build = []
+            for n in ready:
+                fp = get_fingerprint(projects[n], [fingerprints[d] for d in deps[n]])
+                fingerprints[n] = fp
+                if not force and state.get(n) == fp:
+                    logging.info(f'{n}: unchanged, skipping')
+                    status[n] = 'unchanged'
+                else:
+                    to_build.append(n)
+
+            for i, n in enumerate(to_build):
+                if free < 1 and running:
+                    del fingerprints[n]  # try again when cores are free
+                    continue
+                # share the free cores among the projects to build now
+                jobs = max(1, free // (len(to_build) - i))
+                free -= jobs
+                logging.info(f'{n}: building with {jobs} jobs')
+                running[pool.submit(build, n, projects[n], jobs)] = (n, jobs)
+
+            if not running:
+                continue
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                n, jobs = running.pop(fut)
+                free += jobs
+                try:
+                    fut.result()
+                    status[n] = 'built'
+                    state[n] = fingerprints[n]
+                    if state_fn:
+                        state_fn.parent.mkdir(parents=True, exist_ok=True)
+                        state_fn.write_text(json.dumps(state, indent=1))
+                except BaseException as e:  # SystemExit from a failed build command
+                    logging.error(f'{n}: build failed {e!r}')
+                    status[n] = 'failed'
+
+    return status
+
+
+def build_project(name: str, project: Project, jobs: int, **opts):
+    from . import do_build
+
+    # resource sampling covers all processes of buildmc, so is not per project here
+    params = dict(project, jobs=jobs, log_prefix=name, sample_interval=0, **opts)
+    args = params.pop('args')
+
+    do_build(params, args)
+
+
+def get_state_fn(manifest: Path) -> Path:
+
+    key = hashlib.sha256(str(Path(manifest).expanduser().resolve()).encode()).hexdigest()[:16]
+
+    return config.get_cache_dir() / 'batch' / f'{key}.json'
@@ -0,0 +1,205 @@
+from pathlib import Path
+from typing import Any, Dict, List
+from contextlib import contextmanager
+import logging
+import json
+import time
+import os
+
+from .compilers import get_compiler, get_vendor, profile_args, add_flags, find_linker, time_trace_flags
+from .output import Runner
+from . import config
+from . import jobs
+from . import ramdisk
+from . import vendorenv
+
+FLAGS_STAMP = 'buildmc_flags.json'
+# compiler flag variables, read by CMake and Meson only on first configure
+FLAG_VARS = ('CFLAGS', 'CXXFLAGS', 'FFLAGS', 'FCFLAGS', 'CPPFLAGS', 'LDFLAGS')
+
+
+class Builder():
+    """
+    parameters common to each build system
+    """
+
+    build_system = ''
+
+    def __init__(self, params: Dict[str, Any] = {}, args: List[str] = []):
+
+        source_dir = params.get('source_dir', Path.cwd())
+        if not source_dir:
+            source_dir = Path.cwd()
+        self.source_dir = Path(source_dir).expanduser().resolve()
+
+        config_fn = params.get('config_fn')
+        if not config_fn:
+            config_fn = self.source_dir / 'buildmc.ini'
+        self.config_fn = config_fn
+
+        build_dir = params.get('build_dir', self.source_dir / 'build')
+        if not build_dir:
+            build_dir = config.get_build_dir(self.config_fn)
+        if not build_dir:
+            build_dir = self.source_dir / 'build'
+        build_dir = Path(build_dir).expanduser()
+        self.build_dir = build_dir.resolve()
+
+        self.install_dir = params.get('install_dir')
+
+        self.do_test = params.get('do_test')
+
+        if params.get('vendor'):
+            self.vendor = params['vendor']
+        else:
+            self.vendor = config.get_compiler(self.config_fn)
+
+        self.compiler, compiler_args = get_compiler(self.vendor, self.config_fn)
+
+        # environment of the vendor script e.g. Intel setvars.sh, for every build command
+        self.vendor_env = vendorenv.activate(get_vendor(self.compiler), self.config_fn)
+
+        self.args = list(args) + compiler_args
+
+        self.linker = find_linker(self.compiler, params.get('linker') or config.get_linker(self.config_fn),
+                                  self.get_env())
+
+        # each build profile has its own build directory, to switch profiles without rebuilding
+        self.profile = params.get('profile')
+        if self.profile:
+            build_dir = build_dir / self.profile
+            self.build_dir = self.build_dir / self.profile
+            pargs, pflags = profile_args(config.get_profile(self.profile, self.config_fn),
+                                         get_vendor(self.compiler), self.build_system)
+            self.args += pargs
+            add_flags(self.compiler, pflags)
+
+        # compiler self-profiling, in its own build directory as every file is compiled with extra flags
+        self.profile_compile = params.get('profile_compile')
+        if self.profile_compile:
+            build_dir = build_dir / 'profile-compile'
+            self.build_dir = self.build_dir / 'profile-compile'
+            add_flags(self.compiler, time_trace_flags(self.compiler))
+
+        # with a RAM disk, build_dir is in the RAM disk and persist_dir is the usual build directory location
+        self.persist_dir = None
+        if params.get('ramdisk'):
+            root = ramdisk.get_root(config.get_ramdisk(self.config_fn))
+            if root:
+                # not resolved, to keep the symlink from a previous build
+                self.persist_dir = Path(os.path.abspath(build_dir))
+                self.build_dir = ramdisk.setup(self.persist_dir, self.source_dir, root)
+            else:
+                logging.warning('no RAM disk available, set "ramdisk" in buildmc.ini')
+
+        self.memory_budget = params.get('memory_budget')
+        if not self.memory_budget:
+            self.memory_budget = config.get_memory_budget(self.config_fn)
+
+        # CPU cores this build may use, e.g. a share of the machine when building several projects at once
+        self.jobs = params.get('jobs')
+
+        self.unity = params.get('unity')
+        self.unity_size = params.get('unity_size')
+        if not self.unity_size:
+            self.unity_size = config.get_unity_size(self.config_fn)
+
+        # Git ref: build and test only targets affected by files changed since then
+        self.changed_since = params.get('changed_since')
+
+        self.runner = Runner(params.get('log_prefix'), params.get('quiet'), params.get('log_dir'),
+                             env=dict(os.environ, **self.vendor_env) if self.vendor_env else None)
+
+        # seconds between resource samples of the build processes, 0 to not sample
+        self.sample_interval = params.get('sample_interval', 0.5)
+
+        self.wipe_reason = ''
+        self.timings: Dict[str, float] = {}
+        self.current_phase = ''
+
+    def sync_ramdisk(self):
+        """
+        copy artifacts from a RAM disk build directory to persistent storage
+        """
+        if not self.persist_dir:
+            return
+
+        patterns = config.get_ramdisk_artifacts(self.config_fn)
+        if patterns:
+            ramdisk.sync(self.build_dir, self.persist_dir.with_name(self.persist_dir.name + '-artifacts'), patterns)
+
+    def log_wipe(self, reason: str):
+        self.wipe_reason = reason
+        logging.info(reason)
+        # compile memory measured before the wipe may be of other compilers or options
+        log = self.build_dir / jobs.LOG_NAME
+        if log.is_file():
+            log.unlink()
+
+    @contextmanager
+    def phase(self, name: str):
+        """
+        time a phase of the build e.g. configure, build, test, install
+        """
+        tic = time.monotonic()
+        self.current_phase = name
+        try:
+            yield
+        finally:
+            self.current_phase = ''
+            self.timings[name] = self.timings.get(name, 0.) + time.monotonic() - tic
+
+    def get_flags(self) -> Dict[str, str]:
+        """
+        compiler flag variables of the build environment, e.g. from the build profile
+        """
+        return {k: v for k, v in self.get_env().items() if k in FLAG_VARS and v}
+
+    def flags_changed(self) -> bool:
+        """
+        True if the compiler flags differ from those the build directory was configured with
+        """
+        stamp = self.build_dir / FLAGS_STAMP
+        if not stamp.is_file():
+            return False
+
+        old = json.loads(stamp.read_text())
+        new = self.get_flags()
+        if old == new:
+            return False
+
+        self.log_wipe(f'compiler flags changed: {old} => {new}')
+        return True
+
+    def save_flags(self):
+        (self.build_dir / FLAGS_STAMP).write_text(json.dumps(self.get_flags(), indent=1))
+
+    def get_env(self) -> Dict[str, str]:
+        """
+        environment for build system commands, with compilers and compiler flags
+        """
+        env = dict(os.environ)
+        env.update(self.vendor_env)
+        env.update(self.compiler)
+
+        return env
+
+    def get_jobs(self) -> int:
+        """
+        number of parallel jobs: the CPU count (or self.jobs), reduced if needed to fit the memory budget
+        using the largest compile memory seen in this build_dir
+        """
+        budget = jobs.get_memory_budget(self.memory_budget) if self.memory_budget else 0
+        if not budget:
+            return jobs.max_jobs(0, 0, self.jobs)
+
+        log = self.build_dir / jobs.LOG_NAME
+        jobs.trim_log(log)
+        per_job = jobs.peak_rss(log)
+        if not per_job:
+            per_job = jobs.DEFAULT_JOB_MEMORY
+
+        njobs = jobs.max_jobs(budget, per_job, self.jobs)
+        logging.info(f'{njobs} parallel jobs for memory budget {budget >> 20} MB, {per_job >> 20} MB per job')
+
+        return njobs
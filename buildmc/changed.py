@@ -0,0 +1,187 @@
+"""
+targeted builds: build only the targets with source files changed since a Git ref, and the targets
+depending on them, then run only the tests of those targets.
+
+Header files are mapped to targets by the dependencies Ninja records while compiling.
+A change the target graph cannot account for, e.g. to CMakeLists.txt or to a header not yet seen
+by a build, means a full build.
+"""
+from pathlib import Path
+from typing import Any, Dict, List, Set
+import subprocess
+import logging
+import shutil
+import json
+
+BUILD_FILES = ('CMakeLists.txt', 'meson.build', 'meson_options.txt', 'meson.options')
+BUILD_SUFFIXES = ('.cmake',)
+SOURCE_SUFFIXES = ('.c', '.cc', '.cpp', '.cxx', '.c++', '.h', '.hh', '.hpp', '.hxx', '.h++', '.inl', '.ipp',
+                   '.tcc', '.f', '.for', '.f90', '.f95', '.f03', '.f08', '.inc', '.m', '.mm', '.cu', '.cuh',
+                   '.s', '.asm', '.def', '.rc', '.in')
+
+# name: {'sources': set of Path, 'deps': set of target names, 'artifacts': set of Path, 'build': build target}
+Targets = Dict[str, Dict[str, Any]]
+
+
+def changed_files(source_dir: Path, ref: str) -> List[Path]:
+    """
+    files changed under source_dir since Git ref, including uncommitted changes
+    """
+    git = shutil.which('git')
+    if not git:
+        raise FileNotFoundError('Git is needed to find changed files')
+
+    ret = subprocess.run([git, '-C', str(source_dir), 'diff', '--name-only', '--relative', ref, '--'],
+                         stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    if ret.returncode:
+        raise ValueError(f'could not find files changed since {ref}: {ret.stderr}')
+
+    return [(source_dir / f).resolve() for f in ret.stdout.splitlines() if f]
+
+
+def affected_targets(targets: Targets, files: List[Path]) -> Set[str]:
+    """
+    targets containing the changed files, and the targets depending on them.
+    Returns None if a change needs a full build.
+    """
+    owners: Dict[Path, Set[str]] = {}
+    for name, t in targets.items():
+        for src in t['sources']:
+            owners.setdefault(src, set()).add(name)
+
+    hit: Set[str] = set()
+    for f in files:
+        if f.name in BUILD_FILES or f.suffix in BUILD_SUFFIXES:
+            logging.info(f'build system file {f} changed, full build')
+            return None
+        if f in owners:
+            hit |= owners[f]
+        elif f.suffix.lower() in SOURCE_SUFFIXES:
+            logging.info(f'{f} is not in a known target, full build')
+            return None
+        else:
+            logging.debug(f'{f} is not a source file of any target')
+
+    # reverse dependencies
+    while True:
+        more = {name for name, t in targets.items() if name not in hit and t['deps'] & hit}
+        if not more:
+            break
+        hit |= more
+
+    return hit
+
+
+def select_tests(tests: Dict[str, Set[str]], targets: Targets, hit: Set[str]) -> List[str]:
+    """
+    tests: test name: names of targets the test uses, or empty if not known.
+    A test not known to use any target is run if any target is affected.
+    """
+    return [name for name, used in tests.items() if used & hit or (hit and not used)]
+
+
+def add_header_deps(targets: Targets, build_dir: Path, deps: str):
+    """
+    add headers to the sources of the targets compiling them, from "ninja -t deps" output
+    """
+    owners: Dict[Path, Set[str]] = {}
+    for name, t in targets.items():
+        for src in t['sources']:
+            owners.setdefault(src, set()).add(name)
+
+    def add(files: List[Path]):
+        names: Set[str] = set()
+        for f in files:
+            names |= owners.get(f, set())
+        for name in names:
+            targets[name]['sources'].update(files)
+
+    files: List[Path] = []
+    for line in deps.splitlines():
+        if not line.strip():
+            continue
+        if not line[0].isspace():  # next object file
+            add(files)
+            files = []
+        else:
+            files.append((build_dir / line.strip()).resolve())
+    add(files)
+
+
+def ninja_deps(targets: Targets, build_dir: Path):
+    ninja = shutil.which('ninja')
+    if not ninja or not (build_dir / 'build.ninja').is_file():
+        return
+
+    ret = subprocess.run([ninja, '-C', str(build_dir), '-t', 'deps'],
+                         stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True)
+    if not ret.returncode:
+        add_header_deps(targets, build_dir, ret.stdout)
+
+
+def cmake_targets(codemodel: Dict[str, Any], reply_dir: Path) -> Targets:
+    """
+    targets of the first configuration of cmake-file-api codemodel-v2
+    """
+    source_dir = Path(codemodel['paths']['source'])
+    build_dir = Path(codemodel['paths']['build'])
+
+    ids = {}
+    for t in codemodel['configurations'][0]['targets']:
+        ids[t['id']] = json.loads((reply_dir / t['jsonFile']).read_text())
+
+    targets: Targets = {}
+    for t in ids.values():
+        targets[t['name']] = {'sources': {(source_dir / s['path']).resolve() for s in t.get('sources', [])},
+                              'deps': {ids[d['id']]['name'] for d in t.get('dependencies', []) if d['id'] in ids},
+                              'artifacts': {(build_dir / a['path']).resolve() for a in t.get('artifacts', [])},
+                              'build': t['name']}
+
+    return targets
+
+
+def meson_targets(intro_targets: List[Dict[str, Any]], build_dir: Path) -> Targets:
+    """
+    targets from meson-info/intro-targets.json. Meson >= 0.50
+    Link dependencies are the linker arguments naming another target's output.
+    """
+    outputs: Dict[Path, str] = {}
+    for t in intro_targets:
+        for f in t['filename']:
+            outputs[Path(f).resolve()] = t['id']
+
+    targets: Targets = {}
+    for t in intro_targets:
+        sources: Set[Path] = set()
+        deps: Set[str] = set(t.get('depends', []))
+        for group in t['target_sources']:
+            sources.update(Path(s).resolve() for s in group.get('sources', []))
+            for arg in group.get('parameters', []) if 'linker' in group else []:
+                out = (build_dir / arg).resolve()
+                if out in outputs and outputs[out] != t['id']:
+                    deps.add(outputs[out])
+
+        artifacts = {Path(f).resolve() for f in t['filename']}
+        targets[t['id']] = {'sources': sources,
+                            'deps': deps,
+                            'artifacts': artifacts,
+                            'build': str(Path(t['filename'][0]).resolve().relative_to(build_dir.resolve()))}
+
+    return targets
+
+
+def tests_by_command(tests: Dict[str, List[str]], targets: Targets) -> Dict[str, Set[str]]:
+    """
+    tests: test name: command
+    Returns test name: names of targets whose output is in the command
+    """
+    outputs: Dict[Path, str] = {}
+    for name, t in targets.items():
+        for a in t['artifacts']:
+            outputs[a] = name
+
+    used = {}
+    for test, cmd in tests.items():
+        used[test] = {outputs[Path(c).resolve()] for c in cmd if Path(c).resolve() in outputs}
+
+    return used
@@ -0,0 +1,152 @@
+"""
+CMake configure check results (check_include_file, check_symbol_exists, check_*_source_compiles, ...)
+are the same for a given toolchain in every build directory of a project.
+They are saved per project and toolchain fingerprint and given to cold configures as a CMake
+initial-cache script, so the checks are not compiled again.
+Only checks that passed are saved: a failed check e.g. of a header installed later is run again.
+
+Library search results found with the -D<LIB>_ROOT hints of buildmc.ini are saved
+per toolchain and hint directory likewise.
+"""
+from pathlib import Path
+from typing import Dict, List, Tuple
+import hashlib
+import re
+
+from . import config
+
+INIT_NAME = 'buildmc_init.cmake'
+
+CHECKS = re.compile(r'(HAVE_\w+|\w+_COMPILES|\w+_RUNS|\w+_EXITCODE|\w*SUPPORTS_\w+|SIZEOF_\w+)$')
+LANGS = ('C', 'CXX', 'Fortran')
+# CMake false constants
+FALSE = ('', '0', 'OFF', 'NO', 'FALSE', 'N', 'IGNORE', 'NOTFOUND')
+
+Cache = Dict[str, Tuple[str, str]]
+
+
+def read_cache(fn: Path) -> Cache:
+    """
+    CMakeCache.txt entries NAME:TYPE=VALUE as {name: (type, value)}
+    """
+    cache: Cache = {}
+    if not fn.is_file():
+        return cache
+
+    for line in fn.read_text(errors='replace').splitlines():
+        if not line or line.startswith(('#', '//')):
+            continue
+        key, sep, value = line.partition('=')
+        if not sep:
+            continue
+        name, _, typ = key.rpartition(':')
+        if name:
+            cache[name] = (typ, value)
+
+    return cache
+
+
+def passed(name: str, value: str) -> bool:
+    """
+    True if the check result is of a check that passed
+    """
+    if name.endswith('_EXITCODE'):
+        return value == '0'
+
+    return value.upper() not in FALSE and not value.endswith('-NOTFOUND')
+
+
+def get_checks(cache: Cache) -> Cache:
+    checks = {k: v for k, v in cache.items() if v[0] == 'INTERNAL' and CHECKS.match(k) and passed(k, v[1])}
+
+    # compilers that configured successfully need not be tested again with a try_compile
+    for lang in LANGS:
+        c = cache.get(f'CMAKE_{lang}_COMPILER', ('', ''))[1]
+        if c and not c.endswith('NOTFOUND'):
+            checks[f'CMAKE_{lang}_COMPILER_WORKS'] = ('INTERNAL', 'TRUE')
+
+    return checks
+
+
+def get_lib_results(cache: Cache, lib: str) -> Cache:
+    """
+    paths found for library "lib", e.g. LAPACK_LIBRARY, LAPACK_INCLUDE_DIR, LAPACK_DIR
+    """
+    prefix = lib.upper() + '_'
+
+    return {k: v for k, v in cache.items()
+            if k.upper().startswith(prefix) and v[0] in ('PATH', 'FILEPATH') and
+            not v[1].endswith('NOTFOUND')}
+
+
+def get_store(toolchain: str, source_dir: Path = None, lib: str = None, lib_root: str = None) -> Path:
+    """
+    file of the check results of the project in source_dir, or of the library search results of lib
+    """
+    name = toolchain
+    if lib:
+        name += '-' + lib + '-' + hashlib.sha256(str(lib_root).encode()).hexdigest()[:16]
+    elif source_dir:
+        name += '-' + hashlib.sha256(str(Path(source_dir).resolve()).encode()).hexdigest()[:16]
+
+    return config.get_cache_dir() / 'configure' / f'{name}.json'
+
+
+def load(fn: Path) -> Cache:
+
+    return {k: tuple(v) for k, v in config.read_json(fn).items()}  # type: ignore
+
+
+def save(fn: Path, entries: Cache):
+    """
+    merge entries into those previously saved
+    """
+    if not entries:
+        return
+
+    old = load(fn)
+    if all(old.get(k) == v for k, v in entries.items()):
+        return
+
+    config.update_json(fn, entries)
+
+
+def save_results(build_dir: Path, source_dir: Path, toolchain: str, libs: Dict[str, str]):
+    """
+    after a successful configure, save check results of build_dir CMakeCache.txt
+
+    libs: {library name: root hint}
+    """
+    cache = read_cache(build_dir / 'CMakeCache.txt')
+
+    save(get_store(toolchain, source_dir), get_checks(cache))
+
+    for lib, root in libs.items():
+        save(get_store(toolchain, lib=lib, lib_root=root), get_lib_results(cache, lib))
+
+
+def write_init(build_dir: Path, source_dir: Path, toolchain: str, libs: Dict[str, str]) -> Path:
+    """
+    write the CMake initial-cache script for a cold configure.
+    Returns None if nothing is saved for this project and toolchain.
+    """
+    # results saved before failed checks were excluded
+    entries = {k: v for k, v in load(get_store(toolchain, source_dir)).items() if passed(k, v[1])}
+
+    for lib, root in libs.items():
+        entries.update({k: v for k, v in load(get_store(toolchain, lib=lib, lib_root=root)).items()
+                        if Path(v[1]).exists()})
+
+    if not entries:
+        return None
+
+    lines: List[str] = [f'# seeded by buildmc for toolchain {toolchain}']
+    for name, (typ, value) in sorted(entries.items()):
+        value = value.replace('\\', '\\\\').replace('"', '\\"').replace('$', '\\$')
+        lines.append(f'set({name} "{value}" CACHE {typ} "")')
+
+    build_dir.mkdir(parents=True, exist_ok=True)
+    init = build_dir / INIT_NAME
+    init.write_text('\n'.join(lines) + '\n')
+
+    return init
@@ -6,14 +6,22 @@ import shutil
 import json
 import pkg_resources
 import logging
+import sys
+import re
 
-from .compilers import is_msvc, get_compiler
+from .builder import Builder
+from .compilers import is_msvc, toolchain_fingerprint, can_choose_linker, get_vendor
+from . import checkcache
+from . import changed
 from . import config
+from . import jobs
 
 MSVC = 'Visual Studio 15 2017'
 
 
-class Cmake():
+class Cmake(Builder):
+
+    build_system = 'cmake'
 
     def __init__(self, params: Dict[str, Any] = {}, args: List[str] = []):
         self.cmake_exe = shutil.which('cmake')
@@ -22,36 +30,14 @@ class Cmake():
 
         self.get_cmake_version()
 
-        source_dir = params.get('source_dir', Path.cwd())
-        if not source_dir:
-            source_dir = Path.cwd()
-        self.source_dir = Path(source_dir).expanduser().resolve()
-
-        config_fn = params.get('config_fn')
-        if not config_fn:
-            config_fn = self.source_dir / 'buildmc.ini'
-        self.config_fn = config_fn
-
-        build_dir = params.get('build_dir', self.source_dir / 'build')
-        if not build_dir:
-            build_dir = config.get_build_dir(self.config_fn)
-        if not build_dir:
-            build_dir = self.source_dir / 'build'
-        self.build_dir = Path(build_dir).expanduser().resolve()
-
-        self.install_dir = params.get('install_dir')
-
-        self.do_test = params.get('do_test')
+        super().__init__(params, args)
 
-        if params.get('vendor'):
-            self.vendor = params['vendor']
-        else:
-            self.vendor = config.get_compiler(self.config_fn)
+        self.msvc_generator = params.get('msvc_cmake')
 
-        self.compiler, compiler_args = get_compiler(self.vendor)
+        self.reply_dir = self.build_dir / '.cmake/api/v1/reply'
 
-        self.args = args
-        self.args += compiler_args
+        # record link times with buildmc.launcher
+        self.time_links = False
 
     def get_cmake_version(self):
         ret = subprocess.check_output([self.cmake_exe, '--version'], universal_newlines=True)
@@ -60,6 +46,10 @@ class Cmake():
     def config(self, wipe: bool = False):
         """
         attempt to build using CMake >= 3
+
+        CMake configures at most once per invocation, and not at all when the existing cache
+        already has the requested generator and cache variables.
+        Changes to CMakeLists.txt are left to the regeneration check of "cmake --build".
         """
 
         cmakelists = self.source_dir / 'CMakeLists.txt'
@@ -68,74 +58,50 @@ class Cmake():
 
     # %% wipe
         if self.needs_wipe(wipe):
-            Path(self.build_dir / 'CMakeCache.txt').unlink()
+            if (self.build_dir / 'CMakeCache.txt').is_file():
+                (self.build_dir / 'CMakeCache.txt').unlink()
             shutil.rmtree(self.build_dir/'CMakeFiles', ignore_errors=True)
 
-        self.generate()
+        with self.phase('configure'):
+            if self.needs_generate():
+                self.generate()
+            else:
+                logging.info(f'CMake cache up to date in {self.build_dir}, skipping configure')
+            self.save_flags()
+
+        targets = self.get_changed_targets() if self.changed_since else None
 
-        self.build()
+        with self.phase('build'):
+            self.build(targets)
 
-        self.test()
+        with self.phase('test'):
+            self.test(targets)
 
-        self.install()
+        with self.phase('install'):
+            self.install()
 
     def needs_wipe(self, wipe: bool) -> bool:
         """
-        requires CMake >= 3.14
-
-        uses cmake-file-api
-
-        https://cmake.org/cmake/help/latest/manual/cmake-file-api.7.html
-
-        index file is largest in lexiographical order:
-        https://cmake.org/cmake/help/latest/manual/cmake-file-api.7.html#v1-reply-index-file
+        checks the CMake cache for a change of OS, compiler or compiler flags
         """
         if wipe:
+            self.log_wipe('wipe requested')
             return True
 
-        if not (self.build_dir / 'CMakeCache.txt').is_file():
-            return False
+        cache = self.get_cache()
 
-        # do this only when asked to use API, to allow basic use with older CMake
-        if self.version < pkg_resources.parse_version('3.14'):
-            logging.debug('CMake >= 3.14 required for CMake-file-api')
+        gen = cache.get('CMAKE_GENERATOR')
+        if not gen:
             return False
 
-        api_dir = self.build_dir / '.cmake/api/v1'
-        query_dir = api_dir / 'query'
-        query_dir.mkdir(parents=True, exist_ok=True)
-
-        # request CMake Cache info
-        (query_dir / 'cache-v2').touch()
-
-        resp_dir = api_dir / 'reply'
-        indices = sorted(resp_dir.glob('index-*.json'), reverse=True)
-        if indices:
-            index_fn = indices[0]
-            if (self.source_dir / 'CMakeLists.txt').stat().st_mtime > index_fn.stat().st_mtime:
-                logging.info('CMakeLists.txt modified after response index, regenerating')
-                self.generate()
-                index_fn = sorted(resp_dir.glob('index-*.json'), reverse=True)[0]
-        else:
-            logging.info('CMake run for first generation')
-            self.generate()
-            index_fn = sorted(resp_dir.glob('index-*.json'), reverse=True)[0]
-
-        index = json.loads(index_fn.read_text())
-        cache_fn = resp_dir / index['reply']['cache-v2']['jsonFile']
-
-        cmakecache = json.loads(cache_fn.read_text())
-        cache = {entry['name']: entry['value'] for entry in cmakecache['entries']}
-
-        gen = cache['CMAKE_GENERATOR']
         if gen.startswith('Unix') and os.name == 'nt':
-            logging.info('regenerating due to OS change: Unix => Windows')
+            self.log_wipe('regenerating due to OS change: Unix => Windows')
             return True
         elif gen.startswith('MinGW') and os.name != 'nt':
-            logging.info('regenerating due to OS change: Windows => Unix')
+            self.log_wipe('regenerating due to OS change: Windows => Unix')
             return True
         elif gen.startswith('Visual') and not is_msvc(self.compiler):
-            logging.info(f'regenerating due to C compiler change: MSVC => {self.compiler["CC"]}')
+            self.log_wipe(f'regenerating due to C compiler change: MSVC => {self.compiler["CC"]}')
             return True
 
         if self.check_compiler_cache(cache, 'CC', 'C'):
@@ -145,49 +111,206 @@ class Cmake():
         if self.check_compiler_cache(cache, 'FC', 'Fortran'):
             return True
 
+        if self.flags_changed():
+            return True
+
         return wipe
 
-    def generate(self):
+    def get_cache(self) -> Dict[str, str]:
         """
-        CMake Generate
+        CMake cache variables, from cmake-file-api if its reply is current, else from CMakeCache.txt
+        """
+        cache_txt = self.build_dir / 'CMakeCache.txt'
+        if not cache_txt.is_file():
+            return {}
+
+        cmakecache = self.read_api('cache-v2')
+        if cmakecache:
+            return {entry['name']: entry['value'] for entry in cmakecache['entries']}
+
+        return {k: v[1] for k, v in checkcache.read_cache(cache_txt).items()}
+
+    def read_api(self, kind: str) -> Dict[str, Any]:
         """
+        cmake-file-api reply object e.g. cache-v2, codemodel-v2, if the reply is current
+
+        cmake-file-api requires CMake >= 3.14
+        https://cmake.org/cmake/help/latest/manual/cmake-file-api.7.html
+
+        index file is largest in lexiographical order:
+        https://cmake.org/cmake/help/latest/manual/cmake-file-api.7.html#v1-reply-index-file
+        """
+        cache_txt = self.build_dir / 'CMakeCache.txt'
+
+        indices = sorted(self.reply_dir.glob('index-*.json'), reverse=True)
+        if not indices or not cache_txt.is_file() or indices[0].stat().st_mtime < cache_txt.stat().st_mtime:
+            return {}
+
+        index = json.loads(indices[0].read_text())
+        reply = index['reply'].get(kind)
+        if not reply or 'jsonFile' not in reply:
+            return {}
+
+        return json.loads((self.reply_dir / reply['jsonFile']).read_text())
+
+    def needs_generate(self) -> bool:
+        """
+        True unless the build system was generated with the requested generator and cache variables
+        """
+        cache = self.get_cache()
+        if not cache:
+            return True
+
+        if not any((self.build_dir / f).is_file() for f in ('Makefile', 'build.ninja')) and \
+                not any(self.build_dir.glob('*.sln')):
+            logging.info('build system files missing, configuring')
+            return True
+
+        if self.changed_since and not self.read_api('codemodel-v2'):
+            logging.info('configuring for CMake code model')
+            return True
+
+        opts = self.get_generate_args()
+        i = 0
+        while i < len(opts):
+            opt = opts[i]
+            i += 1
+            if opt in ('-G', '-A'):
+                name = 'CMAKE_GENERATOR' if opt == '-G' else 'CMAKE_GENERATOR_PLATFORM'
+                value = opts[i]
+                i += 1
+            elif opt.startswith('-D'):
+                name, _, value = opt[2:].partition('=')
+                name = name.split(':')[0]
+            else:
+                logging.info(f'configuring due to option {opt}')
+                return True
+
+            if not same_cache_value(cache.get(name), value):
+                logging.info(f'configuring due to {name} change: {cache.get(name)} => {value}')
+                return True
+
+        return False
+
+    def get_generator_args(self) -> List[str]:
 
-        wopts: List[str]
         if is_msvc(self.compiler):
-            gen = self.get_msvc_generator()
-            wopts = ['-G', gen, '-A', 'x64']
+            gen = self.get_msvc_generator(self.msvc_generator)
+            return ['-G', gen, '-A', 'x64']
         elif os.name == 'nt':
-            wopts = ['-G', 'MinGW Makefiles', '-DCMAKE_SH=CMAKE_SH-NOTFOUND']
-        else:
-            wopts = []
+            return ['-G', 'MinGW Makefiles', '-DCMAKE_SH=CMAKE_SH-NOTFOUND']
+
+        return []
+
+    def get_generate_args(self) -> List[str]:
+        """
+        generator and cache variable arguments of the CMake configure command
+        """
+
+        wopts = self.get_generator_args()
+
+        # before self.args, so that user arguments take precedence
+        wopts += self.get_linker_args()
 
         wopts += self.args
 
         wopts += self.get_libargs()
 
+        wopts += self.get_launcher_args()
+
+        wopts += self.get_unity_args()
+
         if self.install_dir:  # path specified
             wopts.append('-DCMAKE_INSTALL_PREFIX:PATH=' +
                          str(Path(self.install_dir).expanduser()))
 
+        return wopts
+
+    def generate(self):
+        """
+        CMake Generate
+        """
+
+        wopts = self.get_generate_args()
+
+        toolchain = toolchain_fingerprint(self.compiler, [str(self.version)] + self.get_generator_args() +
+                                          self.get_linker_args() +
+                                          [a for a in self.args if a.startswith('-DCMAKE_')])
+        libroots = self.get_libroots()
+
+        # cold configure: pre-seed configure check results from previous builds of the project with this toolchain
+        if not (self.build_dir / 'CMakeCache.txt').is_file():
+            init = checkcache.write_init(self.build_dir, self.source_dir, toolchain, libroots)
+            if init:
+                logging.info(f'seeding CMake cache with configure results from {init}')
+                wopts = ['-C', str(init)] + wopts
+
+        self.request_api()
+
         gen_cmd = [self.cmake_exe] + wopts
 
         if self.version >= pkg_resources.parse_version('3.13'):
             # Creates build_dir if not exist
             gen_cmd += ['-S', str(self.source_dir), '-B', str(self.build_dir)]
-            ret = subprocess.run(gen_cmd, env=os.environ.update(self.compiler))
+            ret = self.runner.run(gen_cmd, env=self.get_env())
         else:  # build_dir must exist
             gen_cmd += [str(self.source_dir)]
-            ret = subprocess.run(gen_cmd, cwd=self.build_dir, env=os.environ.update(self.compiler))
+            ret = self.runner.run(gen_cmd, cwd=self.build_dir, env=self.get_env())
 
         if ret.returncode:
             raise SystemExit(' '.join(gen_cmd))
 
-    def test(self):
+        checkcache.save_results(self.build_dir, self.source_dir, toolchain, libroots)
+
+    def request_api(self):
+        """
+        cmake-file-api queries are answered by the next configure.  CMake >= 3.14
+        """
+        if self.version < pkg_resources.parse_version('3.14'):
+            return
+
+        query_dir = self.build_dir / '.cmake/api/v1/query'
+        query_dir.mkdir(parents=True, exist_ok=True)
+
+        # request CMake Cache info
+        (query_dir / 'cache-v2').touch()
+        # targets and their sources, for builds of changed targets
+        if self.changed_since:
+            (query_dir / 'codemodel-v2').touch()
+
+    def get_changed_targets(self) -> Dict[str, Dict[str, Any]]:
+        """
+        targets affected by files changed since self.changed_since, or None for a full build
+        """
+        codemodel = self.read_api('codemodel-v2')
+        if not codemodel:
+            logging.warning('CMake code model not available, full build')
+            return None
+
+        targets = changed.cmake_targets(codemodel, self.reply_dir)
+        changed.ninja_deps(targets, self.build_dir)
+
+        hit = changed.affected_targets(targets, changed.changed_files(self.source_dir, self.changed_since))
+        if hit is None:
+            return None
+
+        logging.info(f'targets affected by changes since {self.changed_since}: {sorted(hit)}')
+
+        return {name: targets[name] for name in hit}
+
+    def test(self, targets: Dict[str, Dict[str, Any]] = None):
+        """
+        targets: if given, only tests using these targets are run
+        """
         if not self.do_test:
             return
 
+        if targets is not None and not targets:
+            logging.info('no targets affected, skipping tests')
+            return
+
         if is_msvc(self.compiler):
-            ret = subprocess.run([self.cmake_exe, '--build', str(self.build_dir), '--target', 'RUN_TESTS'])
+            ret = self.runner.run([self.cmake_exe, '--build', str(self.build_dir), '--target', 'RUN_TESTS'])
             if ret.returncode:
                 raise SystemExit(ret.returncode)
         else:
@@ -195,10 +318,32 @@ class Cmake():
             if not ctest_exe:
                 raise FileNotFoundError('CTest not available')
             # ctest --parallel   CMake >= 3.0
-            ret = subprocess.run([ctest_exe, '--parallel', '--output-on-failure'], cwd=self.build_dir)
+            test_cmd = [ctest_exe, '--parallel', str(self.get_jobs()), '--output-on-failure']
+            if targets is not None:
+                tests = self.select_tests(ctest_exe, targets)
+                if not tests:
+                    logging.info('no tests use the affected targets')
+                    return
+                test_cmd += ['-R', '^(' + '|'.join(map(re.escape, tests)) + ')$']
+            ret = self.runner.run(test_cmd, cwd=self.build_dir)
             if ret.returncode:
                 raise SystemExit(ret.returncode)
 
+    def select_tests(self, ctest_exe: str, targets: Dict[str, Dict[str, Any]]) -> List[str]:
+        """
+        tests running the output of an affected target.  ctest --show-only=json-v1  CMake >= 3.14
+        Tests of targets not built have no command, and are not run.
+        """
+        ret = subprocess.run([ctest_exe, '--show-only=json-v1'], cwd=self.build_dir,
+                             stdout=subprocess.PIPE, universal_newlines=True)
+        if ret.returncode:
+            raise SystemExit(ret.returncode)
+
+        alltargets = changed.cmake_targets(self.read_api('codemodel-v2'), self.reply_dir)
+        tests = {t['name']: t['command'] for t in json.loads(ret.stdout)['tests'] if t.get('command')}
+
+        return changed.select_tests(changed.tests_by_command(tests, alltargets), alltargets, set(targets))
+
     def install(self):
         if not self.install_dir:
             return
@@ -206,26 +351,38 @@ class Cmake():
         install_cmd = [self.cmake_exe, '--build', str(self.build_dir), '--target', 'install']
 
         if self.version >= pkg_resources.parse_version('3.12'):
-            install_cmd.append('--parallel')
+            install_cmd += ['--parallel', str(self.get_jobs())]
 
-        ret = subprocess.run(install_cmd)
+        ret = self.runner.run(install_cmd)
 
         if ret.returncode:
             raise SystemExit(ret.returncode)
 
-    def build(self):
+    def build(self, targets: Dict[str, Dict[str, Any]] = None):
         """
         excecute the CMake build command, that compiles and links code.
 
+        targets: if given, only these targets are built
+
         cmake --parallel   CMake >= 3.12
+        cmake --target with several targets  CMake >= 3.15
         """
+        if targets is not None and not targets:
+            logging.info(f'no targets affected by changes since {self.changed_since}, skipping build')
+            return
 
         build_cmd = [self.cmake_exe, '--build', str(self.build_dir)]
 
         if self.version >= pkg_resources.parse_version('3.12'):
-            build_cmd.append('--parallel')
+            build_cmd += ['--parallel', str(self.get_jobs())]
 
-        subprocess.check_call(build_cmd)
+        if targets is None:
+            self.runner.check_call(build_cmd)
+        elif self.version >= pkg_resources.parse_version('3.15'):
+            self.runner.check_call(build_cmd + ['--target'] + sorted(t['build'] for t in targets.values()))
+        else:
+            for t in sorted(targets.values(), key=lambda t: t['build']):
+                self.runner.check_call(build_cmd + ['--target', t['build']])
 
     @staticmethod
     def get_msvc_generator(gen: str) -> str:
@@ -249,18 +406,132 @@ class Cmake():
             if c and c != 'NOTFOUND':
                 c = Path(c).stem
                 if not c.startswith(self.compiler[envvar]):
-                    logging.info(f'regenerating due to {cmake_compiler_name} '
-                                 f'compiler change: {c} => {self.compiler[envvar]}')
+                    self.log_wipe(f'regenerating due to {cmake_compiler_name} '
+                                  f'compiler change: {c} => {self.compiler[envvar]}')
                     return True
 
         return False
 
-    def get_libargs(self) -> List[str]:
-        libargs = []
+    def get_unity_args(self) -> List[str]:
+        """
+        CMAKE_UNITY_BUILD  CMake >= 3.16
+        """
+        if not self.unity:
+            return []
+
+        if self.version < pkg_resources.parse_version('3.16'):
+            logging.warning('CMake >= 3.16 required for unity build')
+            return []
+
+        unity = ['-DCMAKE_UNITY_BUILD=ON']
+        if self.unity_size:
+            unity.append(f'-DCMAKE_UNITY_BUILD_BATCH_SIZE={self.unity_size}')
+
+        return unity
+
+    def get_launcher_args(self) -> List[str]:
+        """
+        with a memory budget, compiles are run via buildmc.launcher to measure their peak memory,
+        and to save GCC time reports when profiling compiles.
+        CMAKE_<LANG>_COMPILER_LAUNCHER  CMake >= 3.4, Makefile and Ninja generators
+
+        with self.time_links, links are run via buildmc.launcher to measure their duration.
+        CMAKE_<LANG>_LINKER_LAUNCHER  CMake >= 3.21
+
+        A launcher of the user e.g. ccache is run by buildmc.launcher.
+        """
+        if is_msvc(self.compiler) or os.name == 'nt':
+            return []
+
+        launcher = [sys.executable, str(Path(__file__).with_name('launcher.py'))]
+        log = str(self.build_dir / jobs.LOG_NAME)
+
+        # GCC time reports go to stderr, saved per object file by the launcher
+        time_report = ['-time_report'] if self.profile_compile and get_vendor(self.compiler) == 'gnu' else []
+
+        args = []
+        if (self.memory_budget or time_report) and self.version >= pkg_resources.parse_version('3.4'):
+            args += [f'-DCMAKE_{lang}_COMPILER_LAUNCHER=' +
+                     ';'.join(launcher + time_report + [log] + self.user_launcher(f'CMAKE_{lang}_COMPILER_LAUNCHER'))
+                     for lang in ('C', 'CXX', 'Fortran')]
+
+        if self.time_links and self.version >= pkg_resources.parse_version('3.21'):
+            args += [f'-DCMAKE_{lang}_LINKER_LAUNCHER=' +
+                     ';'.join(launcher + ['-kind', 'link', log] + self.user_launcher(f'CMAKE_{lang}_LINKER_LAUNCHER'))
+                     for lang in ('C', 'CXX', 'Fortran')]
+
+        # restore launchers left in the cache by an earlier run e.g. -linker_compare to those of the user
+        cache = self.get_cache()
+        for kind in ('COMPILER', 'LINKER'):
+            for lang in ('C', 'CXX', 'Fortran'):
+                name = f'CMAKE_{lang}_{kind}_LAUNCHER'
+                if launcher[1] in cache.get(name, '') and not any(a.startswith(f'-D{name}') for a in args):
+                    args.append(f'-D{name}=' + ';'.join(self.user_launcher(name)))
+
+        return args
+
+    def user_launcher(self, name: str) -> List[str]:
+        """
+        launcher e.g. CMAKE_C_COMPILER_LAUNCHER given by the user as -D argument, else as environment variable
+        """
+        for a in reversed(self.args):
+            var, sep, value = a.partition('=')
+            if sep and var.split(':')[0] == f'-D{name}':
+                return [v for v in value.split(';') if v]
+
+        return [v for v in self.get_env().get(name, '').split(';') if v]
+
+    def get_linker_args(self) -> List[str]:
+        """
+        linker chosen by CMAKE_LINKER_TYPE  CMake >= 3.29,
+        else by -fuse-ld= with LDFLAGS in CMAKE_<TYPE>_LINKER_FLAGS.
+        Linker settings are always given, so that a change back to the default linker takes effect.
+        """
+        if not can_choose_linker(self.compiler):
+            return []
+
+        if self.version >= pkg_resources.parse_version('3.29'):
+            if any(a.startswith('-DCMAKE_LINKER_TYPE') for a in self.args):
+                return []
+            # empty for the compiler default linker
+            return ['-DCMAKE_LINKER_TYPE=' + (self.linker.upper() if self.linker else '')]
+
+        flags = self.compiler.get('LDFLAGS', os.environ.get('LDFLAGS', ''))
+        if self.linker:
+            flags = ' '.join(filter(None, (flags, f'-fuse-ld={self.linker}')))
+
+        return [f'-DCMAKE_{t}_LINKER_FLAGS={flags}' for t in ('EXE', 'SHARED', 'MODULE')
+                if not any(a.startswith(f'-DCMAKE_{t}_LINKER_FLAGS') for a in self.args)]
+
+    def get_libroots(self) -> Dict[str, str]:
+        """
+        library root directories from buildmc.ini
+        """
         libs = config.get_library(self.config_fn)
-        for lib, lib_dir in libs.items():
-            if len(lib_dir) != 1:
-                continue
-            libargs.append(f'-D{lib.upper()}_ROOT={lib_dir[0]}')
 
-        return libargs
+        return {lib: lib_dir[0] for lib, lib_dir in libs.items() if len(lib_dir) == 1}
+
+    def get_libargs(self) -> List[str]:
+        return [f'-D{lib.upper()}_ROOT={root}' for lib, root in self.get_libroots().items()]
+
+
+def same_cache_value(cached: str, value: str) -> bool:
+    """
+    compare a requested -D value with the CMake cache, allowing for CMake boolean spellings
+    and for paths that CMake stores made absolute with forward slashes
+    """
+    if cached is None:
+        return False
+
+    if cached == value:
+        return True
+
+    bools = {'ON': True, 'TRUE': True, 'YES': True, 'Y': True, '1': True,
+             'OFF': False, 'FALSE': False, 'NO': False, 'N': False, '0': False}
+    if cached.upper() in bools and value.upper() in bools:
+        return bools[cached.upper()] == bools[value.upper()]
+
+    if cached and value and ('/' in value or '\\' in value or value.startswith('~')):
+        return Path(cached).resolve() == Path(value).expanduser().resolve()
+
+    return False
@@ -0,0 +1,168 @@
+"""
+compiler self-profiling: which translation units are slow to compile, and why.
+
+Clang and Intel oneAPI compilers write a Chrome trace <object>.json per translation unit with
+-ftime-trace. GCC prints a -ftime-report per translation unit, saved by buildmc.launcher
+as <object>.time-report.txt. These are combined into one report of the slowest translation units,
+the most expensive headers and templates, and frontend (parsing, templates) versus backend
+(optimization, code generation) time.
+"""
+from pathlib import Path
+from typing import Any, Dict, List
+import logging
+import json
+import re
+
+REPORT_NAME = 'buildmc_compile_profile'
+GCC_SUFFIX = '.time-report.txt'
+# Clang time trace events
+TEMPLATE_EVENTS = ('InstantiateClass', 'InstantiateFunction')
+SKIP_DIRS = ('.cmake', 'CMakeFiles/CMakeTmp', 'meson-info', 'meson-private', 'meson-logs')
+
+GCC_LINE = re.compile(r'^\s*(.+?)\s+:\s+([\d.]+)\s*(?:\(\s*\d+%\))?\s+([\d.]+)\s*(?:\(\s*\d+%\))?\s+([\d.]+)')
+GCC_FRONTEND = ('phase parsing', 'phase lang. deferred')
+GCC_BACKEND = ('phase opt and generate',)
+GCC_TEMPLATES = 'template instantiation'
+
+Report = Dict[str, Any]
+
+
+def read_clang_trace(fn: Path) -> Report:
+    """
+    times in seconds from a -ftime-trace file, or None if fn is not a time trace
+    """
+    try:
+        trace = json.loads(fn.read_text(errors='replace'))
+    except ValueError:
+        return None
+    if not isinstance(trace, dict) or 'traceEvents' not in trace:
+        return None
+
+    unit: Report = {'seconds': 0., 'frontend': 0., 'backend': 0., 'headers': {}, 'templates': {}}
+
+    for ev in trace['traceEvents']:
+        dur = ev.get('dur')
+        if dur is None:
+            continue
+        name = ev.get('name')
+        sec = dur / 1e6
+        detail = ev.get('args', {}).get('detail')
+        if name == 'Total ExecuteCompiler':
+            unit['seconds'] = sec
+        elif name == 'Total Frontend':
+            unit['frontend'] = sec
+        elif name == 'Total Backend':
+            unit['backend'] = sec
+        elif name == 'Source' and detail:
+            unit['headers'][detail] = unit['headers'].get(detail, 0.) + sec
+        elif name in TEMPLATE_EVENTS and detail:
+            unit['templates'][detail] = unit['templates'].get(detail, 0.) + sec
+
+    return unit
+
+
+def read_gcc_report(fn: Path) -> Report:
+    """
+    wall times in seconds from GCC -ftime-report output.
+    GCC reports template instantiation time, but not which headers or templates.
+    """
+    unit: Report = {'seconds': 0., 'frontend': 0., 'backend': 0., 'headers': {}, 'templates': {}}
+
+    for line in fn.read_text(errors='replace').splitlines():
+        m = GCC_LINE.match(line)
+        if not m:
+            continue
+        name, wall = m.group(1).strip(), float(m.group(4))
+        if name == 'TOTAL':
+            unit['seconds'] = wall
+        elif name in GCC_FRONTEND:
+            unit['frontend'] += wall
+        elif name in GCC_BACKEND:
+            unit['backend'] += wall
+        elif name == GCC_TEMPLATES:
+            unit['templates']['(all templates)'] = wall
+
+    return unit
+
+
+def collect(build_dir: Path, since: float = 0) -> Report:
+    """
+    combine the compiler time reports written in build_dir since time "since"
+    """
+    units: List[Report] = []
+    headers: Dict[str, List[float]] = {}
+    templates: Dict[str, List[float]] = {}
+
+    for fn in sorted(build_dir.rglob('*.json')) + sorted(build_dir.rglob('*' + GCC_SUFFIX)):
+        rel = fn.relative_to(build_dir).as_posix()
+        if rel.startswith(SKIP_DIRS) or fn.stat().st_mtime < since:
+            continue
+        if fn.name.endswith(GCC_SUFFIX):
+            unit = read_gcc_report(fn)
+            unit['file'] = rel[:-len(GCC_SUFFIX)]
+        else:
+            unit = read_clang_trace(fn)
+            if unit is None:
+                continue
+            unit['file'] = rel[:-len('.json')]
+
+        for h, sec in unit.pop('headers').items():
+            headers.setdefault(h, []).append(sec)
+        for t, sec in unit.pop('templates').items():
+            templates.setdefault(t, []).append(sec)
+        units.append(unit)
+
+    units.sort(key=lambda u: u['seconds'], reverse=True)
+
+    return {'units': units,
+            'seconds': sum(u['seconds'] for u in units),
+            'frontend': sum(u['frontend'] for u in units),
+            'backend': sum(u['backend'] for u in units),
+            'headers': rank(headers),
+            'templates': rank(templates)}
+
+
+def rank(times: Dict[str, List[float]]) -> List[Dict[str, Any]]:
+    ranked = [{'name': k, 'seconds': sum(v), 'count': len(v)} for k, v in times.items()]
+
+    return sorted(ranked, key=lambda r: r['seconds'], reverse=True)
+
+
+def summary(report: Report, n: int = 10) -> str:
+
+    lines = [f'{len(report["units"])} translation units, {report["seconds"]:.1f} s compile time: '
+             f'frontend {report["frontend"]:.1f} s, backend {report["backend"]:.1f} s',
+             '',
+             'slowest translation units:          seconds  frontend  backend']
+    for u in report['units'][:n]:
+        lines.append(f'  {u["file"]:<32} {u["seconds"]:8.2f}  {u["frontend"]:8.2f}  {u["backend"]:7.2f}')
+
+    if report['headers']:
+        lines += ['', 'most expensive headers, including their own includes:  seconds  included']
+        for h in report['headers'][:n]:
+            lines.append(f'  {h["name"]:<52} {h["seconds"]:8.2f}  {h["count"]:8d}')
+
+    if report['templates']:
+        lines += ['', 'most expensive template instantiations:  seconds  count']
+        for t in report['templates'][:n]:
+            lines.append(f'  {t["name"][:36]:<38} {t["seconds"]:8.2f}  {t["count"]:5d}')
+
+    return '\n'.join(lines) + '\n'
+
+
+def report(build_dir: Path, since: float = 0) -> Report:
+    """
+    write build_dir/buildmc_compile_profile.json and .txt, and print the summary
+    """
+    rep = collect(build_dir, since)
+    if not rep['units']:
+        logging.warning(f'no compiler time reports found in {build_dir}')
+        return rep
+
+    text = summary(rep)
+    (build_dir / (REPORT_NAME + '.json')).write_text(json.dumps(rep, indent=1))
+    (build_dir / (REPORT_NAME + '.txt')).write_text(text)
+    print(text)
+    logging.info(f'compile profile written to {build_dir / REPORT_NAME}.json')
+
+    return rep
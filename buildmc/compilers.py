@@ -1,11 +1,26 @@
 from typing import Dict, Tuple, List, Union, Sequence
+from pathlib import Path
+from configparser import ConfigParser
+import subprocess
+import tempfile
+import re
+import logging
+import hashlib
 import os
 import shutil
 
 from . import config
+from . import vendorenv
 
 
-def get_compiler(vendor: Sequence[str]) -> Tuple[Dict[str, str], List[str]]:
+# fastest first
+LINKERS = ('mold', 'lld', 'gold')
+LINKER_EXES = {'mold': ('ld.mold', 'mold'), 'lld': ('ld.lld',), 'gold': ('ld.gold',)}
+# compiler vendors selecting the linker by -fuse-ld=
+LINK_VENDORS = ('gnu', 'clang', 'intel')
+
+
+def get_compiler(vendor: Sequence[str], cfgfn: Path = None) -> Tuple[Dict[str, str], List[str]]:
 
     if not vendor:
         vendor = ['gnu']
@@ -19,7 +34,7 @@ def get_compiler(vendor: Sequence[str]) -> Tuple[Dict[str, str], List[str]]:
     elif vs.intersection(('clang', 'flang', 'llvm')):
         compilers, args = clang_params()
     elif vs.intersection(('intel', 'icl', 'icc')):
-        compilers, args = intel_params()
+        compilers, args = intel_params(cfgfn)
     elif vs.intersection(('msvc', 'cl')):
         compilers, args = msvc_params()
     elif vs.intersection(('clangcl', 'clang-cl')):
@@ -64,24 +79,28 @@ def gnu_params() -> Tuple[Dict[str, str], List[str]]:
     return compilers, args
 
 
-def intel_params() -> Tuple[Dict[str, str], List[str]]:
+def intel_params(cfgfn: Path = None) -> Tuple[Dict[str, str], List[str]]:
     """
-    Intel compilers
+    Intel compilers: classic, else oneAPI.
+    If not already active, the environment of the Intel setvars / compilervars script is used, see vendorenv.
     """
-    if not os.environ.get('MKLROOT'):
-        raise EnvironmentError('must have set MKLROOT by running compilervars.bat or source compilervars.sh before this script.')
+    env = dict(os.environ, **vendorenv.activate('intel', cfgfn))
+    if not any(env.get(v) for v in vendorenv.ACTIVE['intel'] + ('ONEAPI_ROOT',)):
+        raise EnvironmentError('Intel compiler environment not found: set "intel_env" in buildmc.ini '
+                               'to the path of setvars or compilervars, or run it before this script.')
 
     # %% compiler variables
-    compilers = {'FC': 'ifort'}
-
     if os.name == 'nt':
-        compilers['CC'] = compilers['CXX'] = 'icl'
+        compilers = {'CC': 'icl', 'CXX': 'icl', 'FC': 'ifort'}
+        oneapi = {'CC': 'icx', 'CXX': 'icx', 'FC': 'ifx'}
     else:
-        compilers['CC'] = 'icc'
-        compilers['CXX'] = 'icpc'
+        compilers = {'CC': 'icc', 'CXX': 'icpc', 'FC': 'ifort'}
+        oneapi = {'CC': 'icx', 'CXX': 'icpx', 'FC': 'ifx'}
 
-    if not shutil.which(compilers['CC']):
-        raise EnvironmentError('Intel compiler not found')
+    if not shutil.which(compilers['CC'], path=env.get('PATH')):
+        compilers = oneapi
+        if not shutil.which(compilers['CC'], path=env.get('PATH')):
+            raise EnvironmentError('Intel compiler not found')
 
     args: List[str] = []
 
@@ -175,3 +194,297 @@ def is_msvc(cc: Union[str, Dict[str, str]]) -> bool:
     cc = str(cc)
 
     return cc.startswith('cl') and not cc.startswith('clang')
+
+
+def get_vendor(compiler: Dict[str, str]) -> str:
+    """
+    compiler vendor from the C compiler name, as from get_compiler()
+    """
+    cc = Path(compiler.get('CC', '')).stem
+
+    if cc.startswith('clang-cl'):
+        return 'clangcl'
+    elif cc.startswith('clang'):
+        return 'clang'
+    elif cc.startswith(('gcc', 'cc')):
+        return 'gnu'
+    elif cc.startswith(('icc', 'icl', 'icx')):
+        return 'intel'
+    elif cc.startswith('pg'):
+        return 'pgi'
+    elif is_msvc(cc):
+        return 'msvc'
+
+    raise ValueError(f'unknown compiler vendor for {cc}')
+
+
+def gcc_major(cc: str, env: Dict[str, str] = None) -> int:
+    """
+    major version of GCC compiler cc, 0 if unknown
+    """
+    try:
+        ret = subprocess.run([cc, '-dumpversion'], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                             universal_newlines=True, env=env)
+    except OSError:
+        return 0
+
+    m = re.match(r'(\d+)', ret.stdout.strip())
+
+    return int(m.group(1)) if ret.returncode == 0 and m else 0
+
+
+def pgo_vendor(compiler: Dict[str, str]) -> str:
+    """
+    vendor of the profile-guided optimization flags and tools of the compiler:
+    Intel oneAPI icx is LLVM based, using the Clang flags and llvm-profdata
+    """
+    vendor = get_vendor(compiler)
+    if vendor == 'intel' and Path(compiler['CC']).stem.startswith('icx'):
+        return 'clang'
+
+    return vendor
+
+
+def pgo_flags(vendor: str, phase: str, profile: Path, build_dir: Path = None) -> Dict[str, str]:
+    """
+    profile-guided optimization flags
+
+    phase: 'generate' builds instrumented binaries writing raw profiles into directory "profile".
+           'use' builds optimized with merged profile "profile".
+
+    GCC names profile files by object file path; -fprofile-prefix-path (GCC >= 11)
+    strips build_dir so profiles from one build directory apply to another.
+    Without build_dir, both phases must build in the same directory.
+    """
+    flags: List[str]
+
+    if vendor == 'gnu':
+        if phase == 'generate':
+            flags = [f'-fprofile-generate={profile}', '-fprofile-update=atomic']
+        else:
+            flags = [f'-fprofile-use={profile}', '-fprofile-partial-training', '-fprofile-correction',
+                     '-Wno-missing-profile']
+        if build_dir:
+            flags.append(f'-fprofile-prefix-path={build_dir}')
+    elif vendor == 'clang':
+        if phase == 'generate':
+            flags = [f'-fprofile-instr-generate={profile / "%p.profraw"}']
+        else:
+            flags = [f'-fprofile-instr-use={profile}', '-Wno-profile-instr-unprofiled',
+                     '-Wno-profile-instr-out-of-date']
+    elif vendor == 'intel':
+        if os.name == 'nt':
+            flags = ['/Qprof-gen' if phase == 'generate' else '/Qprof-use', f'/Qprof-dir:{profile}']
+        else:
+            flags = ['-prof-gen' if phase == 'generate' else '-prof-use', f'-prof-dir={profile}']
+    else:
+        raise ValueError(f'profile-guided optimization is not configured for compiler vendor {vendor}')
+
+    flag = ' '.join(flags)
+
+    return {'CFLAGS': flag, 'CXXFLAGS': flag, 'FFLAGS': flag, 'LDFLAGS': flag}
+
+
+def add_flags(compiler: Dict[str, str], flags: Dict[str, str]):
+    """
+    appends flags such as CFLAGS to those of the compiler dict, which is passed as environment
+    variables to the build system. Build systems read these variables only on first configure.
+    """
+    for k, v in flags.items():
+        compiler[k] = ' '.join(filter(None, (compiler.get(k, os.environ.get(k, '')), v)))
+
+
+def toolchain_fingerprint(compiler: Dict[str, str], extra: Sequence[str] = ()) -> str:
+    """
+    identifies compilers by resolved path, size and modification time, which change when
+    the compiler is upgraded, and by compiler flags.
+
+    extra: other settings affecting configure results, e.g. build system version and generator
+    """
+    h = hashlib.sha256()
+
+    for k in ('CC', 'CXX', 'FC'):
+        if not compiler.get(k):
+            continue
+        exe = shutil.which(compiler[k])
+        if exe:
+            st = Path(exe).resolve().stat()
+            h.update(f'{k}={Path(exe).resolve()} {st.st_size} {st.st_mtime_ns}\n'.encode())
+        else:
+            h.update(f'{k}={compiler[k]}\n'.encode())
+
+    for k in ('CFLAGS', 'CXXFLAGS', 'FFLAGS', 'LDFLAGS'):
+        h.update(f'{k}={compiler.get(k, os.environ.get(k, ""))}\n'.encode())
+
+    for e in extra:
+        h.update(f'{e}\n'.encode())
+
+    return h.hexdigest()[:16]
+
+
+def profile_args(profile: Dict[str, str], vendor: str, build_system: str) -> Tuple[List[str], Dict[str, str]]:
+    """
+    build profile (see config.get_profile) to build system arguments and
+    compiler flags (environment variables CFLAGS etc.) for the compiler vendor
+    """
+    def is_on(option: str) -> bool:
+        return ConfigParser.BOOLEAN_STATES[profile.get(option, 'no').lower()]
+
+    debug = profile['build_type'] == 'debug'
+    opt = profile.get('optimization')
+
+    args: List[str] = []
+    flags: List[str] = []
+    link_flags: List[str] = []
+
+    if build_system == 'cmake':
+        args.append('-DCMAKE_BUILD_TYPE=' + ('Debug' if debug else 'Release'))
+        if is_on('lto'):
+            args.append('-DCMAKE_INTERPROCEDURAL_OPTIMIZATION=ON')
+        if opt and not debug:
+            flags += optimization_flags(vendor, opt)
+    elif build_system == 'meson':
+        args.append('--buildtype=' + ('debug' if debug else 'release'))
+        if opt:
+            args.append(f'-Doptimization={opt}')
+        if is_on('lto'):
+            args.append('-Db_lto=true')
+    else:
+        if debug:
+            flags.append('/Zi' if vendor in ('msvc', 'clangcl') else '-g')
+        if opt:
+            flags += optimization_flags(vendor, opt)
+        if is_on('lto'):
+            lto = lto_flags(vendor)
+            flags += lto
+            link_flags += lto
+
+    if is_on('native'):
+        flags += native_flags(vendor)
+
+    env = {}
+    if flags:
+        env = {'CFLAGS': ' '.join(flags), 'CXXFLAGS': ' '.join(flags), 'FFLAGS': ' '.join(flags)}
+    if link_flags:
+        env['LDFLAGS'] = ' '.join(link_flags)
+
+    return args, env
+
+
+def optimization_flags(vendor: str, level: str) -> List[str]:
+    if vendor in ('msvc', 'clangcl'):
+        return ['/Od'] if level == '0' else ['/O2']
+
+    return [f'-O{level}']
+
+
+def native_flags(vendor: str) -> List[str]:
+    """
+    optimize for the CPU of this computer
+    """
+    if vendor in ('gnu', 'clang'):
+        return ['-march=native']
+    elif vendor == 'intel':
+        return ['/QxHost'] if os.name == 'nt' else ['-xHost']
+    elif vendor == 'pgi':
+        return ['-tp=host']
+
+    logging.warning(f'native CPU optimization not configured for compiler vendor {vendor}')
+    return []
+
+
+def lto_flags(vendor: str) -> List[str]:
+    """
+    link-time (interprocedural) optimization, for build systems without a built-in option
+    """
+    if vendor in ('gnu', 'clang'):
+        return ['-flto']
+    elif vendor == 'intel':
+        return ['/Qipo'] if os.name == 'nt' else ['-ipo']
+    elif vendor in ('msvc', 'clangcl'):
+        return ['/GL']
+    elif vendor == 'pgi':
+        return ['-Mipa=fast']
+
+    return []
+
+
+def time_trace_flags(compiler: Dict[str, str]) -> Dict[str, str]:
+    """
+    compiler self-profiling flags: Clang and Intel oneAPI write a time trace per translation unit.
+    GCC -ftime-report prints to stderr, so is added by buildmc.launcher instead.
+    """
+    vendor = get_vendor(compiler)
+
+    if vendor == 'gnu':
+        return {}
+    if vendor == 'clang' or (vendor == 'intel' and Path(compiler['CC']).stem.startswith('icx')):
+        return {'CFLAGS': '-ftime-trace', 'CXXFLAGS': '-ftime-trace'}
+
+    raise ValueError(f'compiler time reports are not configured for {compiler["CC"]}')
+
+
+def can_choose_linker(compiler: Dict[str, str]) -> bool:
+    if os.name == 'nt':
+        return False
+
+    try:
+        return get_vendor(compiler) in LINK_VENDORS
+    except ValueError:
+        return False
+
+
+def find_linker(compiler: Dict[str, str], choice: str = None, env: Dict[str, str] = None) -> str:
+    """
+    linker for -fuse-ld=, or None for the compiler default linker.
+
+    choice: "auto" or None for the fastest linker the C compiler can use, "default" for the compiler default,
+            or a linker name e.g. "lld"
+    env: environment to run the compiler in
+    """
+    if choice == 'default' or not can_choose_linker(compiler):
+        return None
+
+    if choice and choice != 'auto':
+        if probe_linker(compiler['CC'], choice, env):
+            return choice
+        logging.warning(f'{compiler["CC"]} cannot link with {choice}, using default linker')
+        return None
+
+    for ld in LINKERS:
+        if probe_linker(compiler['CC'], ld, env):
+            logging.info(f'linking with {ld}')
+            return ld
+
+    return None
+
+
+def probe_linker(cc: str, ld: str, env: Dict[str, str] = None) -> bool:
+    """
+    True if compiler cc links a test program with -fuse-ld=ld.
+    Results are cached per compiler and linker executable.
+    """
+    exe = None
+    for name in LINKER_EXES.get(ld, (ld,)):
+        exe = shutil.which(name)
+        if exe:
+            break
+    if not exe:
+        return False
+
+    key = toolchain_fingerprint({'CC': cc}, [ld, exe, str(Path(exe).resolve().stat().st_mtime_ns)])
+    cache_fn = config.get_cache_dir() / 'linkers.json'
+    cache = config.read_json(cache_fn)
+    if key in cache:
+        return cache[key]
+
+    with tempfile.TemporaryDirectory() as d:
+        src = Path(d) / 'main.c'
+        src.write_text('int main(void) { return 0; }\n')
+        ret = subprocess.run([cc, f'-fuse-ld={ld}', str(src), '-o', str(Path(d) / 'main')],
+                             stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=env)
+
+    ok = ret.returncode == 0
+    config.update_json(cache_fn, {key: ok})
+
+    return ok
@@ -1,7 +1,19 @@
 from configparser import ConfigParser
-from typing import Dict, List
+from typing import Any, Dict, List
 from pathlib import Path
+import threading
 import logging
+import json
+import os
+import re
+
+# serializes read-merge-write of cache files between build threads
+_cache_lock = threading.Lock()
+
+PROFILES = {'release': {'build_type': 'release', 'optimization': '3', 'native': 'no', 'lto': 'no'},
+            'native': {'build_type': 'release', 'optimization': '3', 'native': 'yes', 'lto': 'no'},
+            'lto': {'build_type': 'release', 'optimization': '3', 'native': 'no', 'lto': 'yes'},
+            'debug': {'build_type': 'debug', 'optimization': '0', 'native': 'no', 'lto': 'no'}}
 
 
 def get_build_dir(cfgfn: Path = None) -> str:
@@ -14,7 +26,7 @@ def get_build_dir(cfgfn: Path = None) -> str:
     C = ConfigParser()
     C.read(cfgfn)
 
-    return C.get('buildmc', 'build_dir')
+    return C.get('buildmc', 'build_dir', fallback=None)
 
 
 def get_library(cfgfn: Path = None) -> Dict[str, List[str]]:
@@ -29,7 +41,7 @@ def get_library(cfgfn: Path = None) -> Dict[str, List[str]]:
     C.read(cfgfn)
 
     libs = {}
-    for l in C.get('buildmc', 'library').split('\n'):
+    for l in C.get('buildmc', 'library', fallback='').split('\n'):
         if not l:
             continue
         lspec = l.split(' ')
@@ -50,7 +62,7 @@ def get_compiler(cfgfn: Path = None) -> List[str]:
     C.read(cfgfn)
 
     cc = []
-    for l in C.get('buildmc', 'compiler').split('\n'):
+    for l in C.get('buildmc', 'compiler', fallback='').split('\n'):
         if not l:
             continue
         lspec = l.split(' ')
@@ -59,6 +71,136 @@ def get_compiler(cfgfn: Path = None) -> List[str]:
     return cc
 
 
+def get_memory_budget(cfgfn: Path = None) -> str:
+    """
+    memory budget for parallel build jobs e.g. "16G", or "auto" for the available memory
+    """
+    cfgfn = get_cfg_path(cfgfn)
+
+    if not cfgfn.is_file():
+        return None
+
+    C = ConfigParser()
+    C.read(cfgfn)
+
+    return C.get('buildmc', 'memory_budget', fallback=None)
+
+
+def get_ramdisk(cfgfn: Path = None) -> str:
+    """
+    tmpfs directory for RAM-disk build directories, if not /dev/shm
+    """
+    cfgfn = get_cfg_path(cfgfn)
+
+    if not cfgfn.is_file():
+        return None
+
+    C = ConfigParser()
+    C.read(cfgfn)
+
+    return C.get('buildmc', 'ramdisk', fallback=None)
+
+
+def get_ramdisk_artifacts(cfgfn: Path = None) -> List[str]:
+    """
+    glob patterns, relative to the build directory, of files copied from a RAM-disk build directory
+    to persistent storage after each build
+    """
+    cfgfn = get_cfg_path(cfgfn)
+
+    if not cfgfn.is_file():
+        return []
+
+    C = ConfigParser()
+    C.read(cfgfn)
+
+    return [g for g in C.get('buildmc', 'ramdisk_artifacts', fallback='').split('\n') if g]
+
+
+def get_linker(cfgfn: Path = None) -> str:
+    """
+    linker: auto (fastest available), default (compiler default), or mold, lld, gold
+    """
+    cfgfn = get_cfg_path(cfgfn)
+
+    if not cfgfn.is_file():
+        return None
+
+    C = ConfigParser()
+    C.read(cfgfn)
+
+    return C.get('buildmc', 'linker', fallback=None)
+
+
+def set_linker(linker: str, cfgfn: Path = None):
+    set_option('buildmc', 'linker', linker, cfgfn)
+
+
+def get_vendor_env(vendor: str, cfgfn: Path = None) -> str:
+    """
+    compiler vendor environment script e.g. "intel_env: /opt/intel/oneapi/setvars.sh",
+    if not in a default install location
+    """
+    cfgfn = get_cfg_path(cfgfn)
+
+    if not cfgfn.is_file():
+        return None
+
+    C = ConfigParser()
+    C.read(cfgfn)
+
+    return C.get('buildmc', f'{vendor}_env', fallback=None)
+
+
+def get_unity_size(cfgfn: Path = None) -> int:
+    """
+    unity build batch size, as saved by buildmc -unity_tune
+    """
+    cfgfn = get_cfg_path(cfgfn)
+
+    if not cfgfn.is_file():
+        return None
+
+    C = ConfigParser()
+    C.read(cfgfn)
+
+    return C.getint('buildmc', 'unity_size', fallback=None)
+
+
+def set_unity_size(size: int, cfgfn: Path = None):
+    set_option('buildmc', 'unity_size', str(size), cfgfn)
+
+
+def get_profile(name: str, cfgfn: Path = None) -> Dict[str, str]:
+    """
+    named build profile, from section [profile.<name>] of buildmc.ini.
+    Unset options are taken from the built-in profile of the same name, else from "release".
+
+    Example buildmc.ini section:
+
+    [profile.native]
+    build_type: release
+    optimization: 3
+    native: yes
+    lto: yes
+    """
+    profile = dict(PROFILES.get(name, PROFILES['release']))
+
+    cfgfn = get_cfg_path(cfgfn)
+
+    if cfgfn.is_file():
+        C = ConfigParser()
+        C.read(cfgfn)
+        if C.has_section(f'profile.{name}'):
+            profile.update(C.items(f'profile.{name}'))
+        elif name not in PROFILES:
+            raise ValueError(f'build profile {name} not in {cfgfn} or built-in profiles {list(PROFILES)}')
+    elif name not in PROFILES:
+        raise ValueError(f'unknown build profile {name}, built-in profiles are {list(PROFILES)}')
+
+    return profile
+
+
 def get_compiler_spec(cfgfn: Path = None) -> Dict[str, str]:
 
     cfgfn = get_cfg_path(cfgfn)
@@ -72,11 +214,89 @@ def get_compiler_spec(cfgfn: Path = None) -> Dict[str, str]:
 
     cspecs = {}
     for k in ('CC', 'CXX', 'FC'):
-        cspecs[k] = C.get('compiler_spec', k)
+        cspecs[k] = C.get('compiler_spec', k, fallback='')
 
     return cspecs
 
 
+def get_cache_dir() -> Path:
+    """
+    per-user directory for data buildmc reuses across projects and build directories
+    """
+    if os.name == 'nt' and os.environ.get('LOCALAPPDATA'):
+        cache_dir = Path(os.environ['LOCALAPPDATA']) / 'buildmc'
+    else:
+        cache_dir = Path(os.environ.get('XDG_CACHE_HOME', '~/.cache')).expanduser() / 'buildmc'
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+
+    return cache_dir
+
+
+def set_option(section: str, key: str, value: str, cfgfn: Path = None):
+    """
+    set one option in buildmc.ini, editing only its line so that comments and the rest of the file are kept
+    """
+    cfgfn = get_cfg_path(cfgfn)
+
+    lines = cfgfn.read_text().splitlines() if cfgfn.is_file() else []
+    new = f'{key}: {value}'
+
+    start = None
+    for i, line in enumerate(lines):
+        if re.match(r'\[\s*' + re.escape(section) + r'\s*\]', line):
+            start = i + 1
+            break
+
+    if start is None:
+        lines += ([''] if lines and lines[-1].strip() else []) + [f'[{section}]', new]
+    else:
+        end = start
+        while end < len(lines) and not lines[end].lstrip().startswith('['):
+            end += 1
+        for i in range(start, end):
+            if re.match(re.escape(key) + r'\s*[:=]', lines[i], re.IGNORECASE):
+                # an indented line after the option continues its value
+                j = i + 1
+                while j < end and lines[j][:1].isspace() and lines[j].strip():
+                    j += 1
+                lines[i:j] = [new]
+                break
+        else:
+            while end > start and not lines[end - 1].strip():
+                end -= 1
+            lines.insert(end, new)
+
+    cfgfn.write_text('\n'.join(lines) + '\n')
+
+
+def read_json(fn: Path) -> Dict[str, Any]:
+    """
+    JSON cache file, empty if missing or unreadable
+    """
+    try:
+        data = json.loads(fn.read_text())
+    except (OSError, ValueError):
+        return {}
+
+    return data if isinstance(data, dict) else {}
+
+
+def update_json(fn: Path, entries: Dict[str, Any]):
+    """
+    merge entries into JSON cache file fn. The file is replaced atomically, so concurrent readers
+    never see a partially written file.
+    """
+    with _cache_lock:
+        data = read_json(fn)
+        data.update(entries)
+
+        fn.parent.mkdir(parents=True, exist_ok=True)
+        tmp = fn.with_name(f'{fn.name}.{os.getpid()}-{threading.get_ident()}.tmp')
+        tmp.write_text(json.dumps(data, indent=1, sort_keys=True))
+        os.replace(tmp, fn)
+
+
 def get_cfg_path(cfgfn: Path) -> Path:
     name = 'buildmc.ini'
 
@@ -0,0 +1,63 @@
+"""
+fingerprints identify the state of project source files, to reuse results cached from previous builds
+"""
+from pathlib import Path
+import subprocess
+import hashlib
+import shutil
+import os
+
+SKIP_DIRS = ('.git', '.hg', '.svn', '__pycache__')
+
+
+def source_fingerprint(source_dir: Path, exclude: Path = None) -> str:
+    """
+    For a Git work tree, the fingerprint is from the tree object of source_dir at HEAD, the
+    uncommitted changes under source_dir, and the untracked files that are not ignored.
+    Otherwise, the fingerprint is from the name, size and modification time of each file.
+
+    exclude: directory to skip, typically the build directory inside source_dir
+    """
+    source_dir = Path(source_dir).resolve()
+
+    h = hashlib.sha256()
+
+    exclude = Path(exclude).resolve() if exclude else None
+
+    git = shutil.which('git')
+    if _in_git_worktree(git, source_dir):
+        tree = subprocess.run([git, '-C', str(source_dir), 'rev-parse', 'HEAD:./'],
+                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        diff = subprocess.run([git, '-C', str(source_dir), 'diff', '--binary', 'HEAD', '--', '.'],
+                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        untracked = subprocess.run([git, '-C', str(source_dir), 'ls-files', '-z', '--others', '--exclude-standard',
+                                    '--', '.'], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        if not tree.returncode and not diff.returncode and not untracked.returncode:
+            h.update(tree.stdout)
+            h.update(diff.stdout)
+            for name in sorted(untracked.stdout.decode(errors='replace').split('\0')):
+                path = source_dir / name
+                if not name or (exclude and exclude in path.parents) or not path.is_file():
+                    continue
+                h.update(f'{name}\n'.encode())
+                h.update(path.read_bytes())
+            return h.hexdigest()[:16]
+
+    for root, dirs, files in os.walk(source_dir):
+        rp = Path(root)
+        dirs[:] = sorted(d for d in dirs if d not in SKIP_DIRS and (rp / d) != exclude)
+        for name in sorted(files):
+            st = (rp / name).stat()
+            h.update(f'{(rp / name).relative_to(source_dir)} {st.st_size} {st.st_mtime_ns}\n'.encode())
+
+    return h.hexdigest()[:16]
+
+
+def _in_git_worktree(git: str, path: Path) -> bool:
+    if not git:
+        return False
+
+    ret = subprocess.run([git, '-C', str(path), 'rev-parse', '--is-inside-work-tree'],
+                         stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True)
+
+    return not ret.returncode and ret.stdout.strip() == 'true'
@@ -1,58 +1,169 @@
-from typing import Dict, Union, List
+from typing import Dict, Any, List, Tuple
 from pathlib import Path
 import shutil
-import subprocess
 import os
+import re
+import json
+import logging
 
+from .builder import Builder
+from .compilers import add_flags, get_vendor
 
-def makebuild(params: Dict[str, Union[str, Path]], compilers: Dict[str, str],
-              args: List[str], *, wipe: bool):
-    """
-    TODO: this function is untested. Let us know if it's of interest
-    """
-    make_exe = shutil.which('make')
-    if not make_exe and os.name == 'nt':
-        make_exe = shutil.which('mingw32-make')
+STAMP = '.buildmc_make.json'
+
+
+class Make(Builder):
+
+    build_system = 'make'
+
+    def __init__(self, params: Dict[str, Any] = {}, args: List[str] = []):
+
+        self.make_exe = shutil.which('make')
+        if not self.make_exe and os.name == 'nt':
+            self.make_exe = shutil.which('mingw32-make')
+
+        if not self.make_exe:
+            raise FileNotFoundError('GNU Make executable not found')
+
+        super().__init__(params, args)
+
+        if self.profile_compile and get_vendor(self.compiler) == 'gnu':
+            raise ValueError('GCC time reports are saved with CMake or Meson only')
+
+        if self.linker:
+            add_flags(self.compiler, {'LDFLAGS': f'-fuse-ld={self.linker}'})
+
+        self.makefile = self.source_dir / 'Makefile'
+
+    def config(self, wipe: bool = False):
+        """
+        attempt to build with GNU Make, out of source tree via "make -C build_dir -f Makefile"
+        """
+
+        if not self.makefile.is_file():
+            raise FileNotFoundError(self.makefile)
+
+        if self.unity:
+            logging.warning('unity build is not available with GNU Make')
+        if self.changed_since:
+            logging.warning('GNU Make has no target information for a build of changed targets, full build')
+
+        self.build_dir.mkdir(parents=True, exist_ok=True)
+
+        if self.needs_wipe(wipe):
+            with self.phase('clean'):
+                self.clean()
+
+        with self.phase('build'):
+            self.build()
+
+        with self.phase('test'):
+            self.test()
+
+        with self.phase('install'):
+            self.install()
+
+    def base_cmd(self) -> List[str]:
+        return [self.make_exe, '-C', str(self.build_dir), '-f', str(self.makefile)]
 
-    if not make_exe:
-        raise FileNotFoundError('GNU Make executable not found')
+    def build(self):
+        """
+        parallel build. Under a parent Make with a jobserver, the parent's job slots are shared
+        instead of adding more jobs on top of the parent's.
+        """
 
-    build_dir = Path(params['build_dir'])
-    source_dir = Path(params['source_dir'])
+        fds = jobserver_fds()
+        if fds is None:
+            build_cmd = self.base_cmd() + [f'-j{self.get_jobs()}', f'-l{os.cpu_count() or 1}']
+        else:
+            build_cmd = self.base_cmd()
 
-    makefile = source_dir / 'Makefile'
+        build_cmd += self.args
 
-    if not makefile.is_file():
-        raise FileNotFoundError(makefile)
+        ret = self.runner.run(build_cmd, env=self.get_env(), pass_fds=fds or ())
+        if ret.returncode:
+            raise SystemExit(ret.returncode)
+
+        (self.build_dir / STAMP).write_text(json.dumps({'os': os.name,
+                                                        'compiler': self.compiler}))
 
-    base_cmd = [make_exe, '-C', str(build_dir), '-f', str(makefile)]
+    def test(self):
+        if not self.do_test:
+            return
 
-    if wipe:
-        ret = subprocess.run(base_cmd+['clean'])
+        ret = self.runner.run(self.base_cmd() + ['test'], env=self.get_env())
         if ret.returncode:
             raise SystemExit(ret.returncode)
 
-    ret = subprocess.run(base_cmd + args, env=os.environ.update(compilers))
-    if ret.returncode:
-        raise SystemExit(ret.returncode)
+    def install(self):
+        if not self.install_dir:
+            return
+
+        ret = self.runner.run(self.base_cmd() + ['install',
+                                                 'prefix=' + str(Path(self.install_dir).expanduser())],
+                              env=self.get_env())
+        if ret.returncode:
+            raise SystemExit(ret.returncode)
+
+    def clean(self):
+        ret = self.runner.run(self.base_cmd() + ['clean'])
+        if ret.returncode:
+            raise SystemExit(ret.returncode)
+
+        stamp = self.build_dir / STAMP
+        if stamp.is_file():
+            stamp.unlink()
+
+    def needs_wipe(self, wipe: bool) -> bool:
+        """
+        Makefiles have no cache of the compiler used, so buildmc leaves a stamp file
+        in build_dir after each successful build.
+        """
+        if wipe:
+            self.log_wipe('wipe requested')
+            return True
+
+        stamp = self.build_dir / STAMP
+        if not stamp.is_file():
+            return False
+
+        cache = json.loads(stamp.read_text())
+
+        if cache.get('os') != os.name:
+            self.log_wipe(f'cleaning due to OS change: {cache.get("os")} => {os.name}')
+            return True
+
+        if cache.get('compiler') != self.compiler:
+            self.log_wipe(f'cleaning due to compiler change: {cache.get("compiler")} => {self.compiler}')
+            return True
+
+        return wipe
+
+
+def jobserver_fds() -> Tuple[int, ...]:
+    """
+    detect a jobserver from a parent Make, e.g. when buildmc is called from a Makefile recipe.
+
+    Returns None if there is no parent jobserver, else the pipe file descriptors
+    the child Make must inherit (empty for a named FIFO jobserver, GNU Make >= 4.4).
+    """
 
-    test_result(ret)
+    flags = os.environ.get('MAKEFLAGS', '')
 
-    if params.get('do_test'):
-        if not ret.returncode:
-            ret = subprocess.run(base_cmd + ['test'])
-            if ret.returncode:
-                raise SystemExit(ret.returncode)
+    m = re.search(r'--jobserver-(?:auth|fds)=(\S+)', flags)
+    if not m:
+        return None
 
-    if params['install_dir']:
-        if not ret.returncode:
-            ret = subprocess.run(base_cmd + ['install', 'prefix='+str(params['install_dir'])])
-            if ret.returncode:
-                raise SystemExit(ret.returncode)
+    auth = m.group(1)
+    if auth.startswith('fifo:'):
+        return ()
 
+    fds = tuple(int(f) for f in auth.split(',') if f.isdigit())
+    for fd in fds:
+        try:
+            os.fstat(fd)
+        except OSError:
+            logging.debug('parent jobserver file descriptors not inherited')
+            return None
 
-def test_result(ret: subprocess.CompletedProcess):
-    if not ret.returncode:
-        print('\nBuild Complete!')
-    else:
-        raise SystemExit(ret.returncode)
+    return fds
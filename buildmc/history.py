@@ -0,0 +1,157 @@
+"""
+local database of build performance, one row per buildmc run, to spot slower builds
+after a code or toolchain change
+"""
+from pathlib import Path
+from typing import Any, Dict, List
+import statistics
+import subprocess
+import sqlite3
+import shutil
+import json
+import time
+import sys
+import os
+
+from .builder import Builder
+from .compilers import get_vendor
+from . import config
+
+DB_NAME = 'history.sqlite'
+
+SCHEMA = """CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    time REAL,
+    source_dir TEXT,
+    build_dir TEXT,
+    git_commit TEXT,
+    vendor TEXT,
+    build_system TEXT,
+    profile TEXT,
+    phases TEXT,
+    seconds REAL,
+    wipe_reason TEXT,
+    cores INTEGER,
+    peak_rss INTEGER,
+    status TEXT)"""
+
+
+def connect(db: Path = None) -> sqlite3.Connection:
+    if not db:
+        db = config.get_cache_dir() / DB_NAME
+
+    conn = sqlite3.connect(str(db))
+    conn.row_factory = sqlite3.Row
+    conn.execute(SCHEMA)
+
+    return conn
+
+
+def record(B: Builder, status: str, seconds: float, db: Path = None, peak_rss: int = None):
+    """
+    store a build run, with the phase timings and wipe reason of Builder B
+
+    peak_rss: peak memory in bytes of the build processes, if measured
+    """
+    row = (time.time(), str(B.source_dir), str(B.build_dir), git_commit(B.source_dir),
+           get_vendor_name(B), B.build_system, B.profile, json.dumps(B.timings), seconds,
+           B.wipe_reason, os.cpu_count(), peak_rss, status)
+
+    with connect(db) as conn:
+        conn.execute('INSERT INTO runs (time, source_dir, build_dir, git_commit, vendor, build_system, profile, '
+                     'phases, seconds, wipe_reason, cores, peak_rss, status) '
+                     'VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?)', row)
+    conn.close()
+
+
+def get_runs(source_dir: Path = None, limit: int = 100, db: Path = None) -> List[Dict[str, Any]]:
+    """
+    most recent runs, oldest first
+    """
+    conn = connect(db)
+    if source_dir:
+        rows = conn.execute('SELECT * FROM runs WHERE source_dir = ? ORDER BY id DESC LIMIT ?',
+                            (str(Path(source_dir).expanduser().resolve()), limit)).fetchall()
+    else:
+        rows = conn.execute('SELECT * FROM runs ORDER BY id DESC LIMIT ?', (limit,)).fetchall()
+    conn.close()
+
+    runs = [dict(r) for r in reversed(rows)]
+    for r in runs:
+        r['phases'] = json.loads(r['phases'])
+
+    return runs
+
+
+def flag_regressions(runs: List[Dict[str, Any]], window: int = 10, threshold: float = 0.2):
+    """
+    Sets run['baseline'] to the median time of up to "window" previous successful runs of the
+    same project, build directory, vendor and build system, and likewise wiped or not.
+    Sets run['slower'] to the fractional slowdown if it exceeds threshold.
+    """
+    previous: Dict[tuple, List[float]] = {}
+
+    for r in runs:
+        key = (r['source_dir'], r['build_dir'], r['vendor'], r['build_system'], bool(r['wipe_reason']))
+        past = previous.setdefault(key, [])
+
+        r['baseline'] = statistics.median(past[-window:]) if past else None
+        r['slower'] = None
+        if r['baseline'] and r['status'] == 'ok':
+            slow = r['seconds'] / r['baseline'] - 1
+            if slow > threshold:
+                r['slower'] = slow
+
+        if r['status'] == 'ok':
+            past.append(r['seconds'])
+
+
+def print_stats(runs: List[Dict[str, Any]]):
+
+    print(f'{"date":<17} {"commit":<10} {"vendor":<7} {"system":<6} {"seconds":>8} {"baseline":>8}  phases')
+    for r in runs:
+        phases = ' '.join(f'{k}={v:.1f}' for k, v in r['phases'].items())
+        baseline = f'{r["baseline"]:8.1f}' if r.get('baseline') else f'{"":8}'
+        line = (f'{time.strftime("%Y-%m-%d %H:%M", time.localtime(r["time"])):<17} {r["git_commit"] or "":<10} '
+                f'{r["vendor"]:<7} {r["build_system"]:<6} {r["seconds"]:8.1f} {baseline}  {phases}')
+        if r['status'] != 'ok':
+            line += '  FAILED'
+        if r['wipe_reason']:
+            line += f'  [{r["wipe_reason"]}]'
+        if r.get('slower'):
+            line += f'  SLOWER {r["slower"]:+.0%}'
+        print(line)
+
+
+def git_commit(source_dir: Path) -> str:
+    git = shutil.which('git')
+    if not git:
+        return None
+
+    ret = subprocess.run([git, '-C', str(source_dir), 'rev-parse', '--short', 'HEAD'],
+                         stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True)
+    if ret.returncode:
+        return None
+
+    return ret.stdout.strip()
+
+
+def get_vendor_name(B: Builder) -> str:
+    try:
+        return get_vendor(B.compiler)
+    except ValueError:
+        return B.compiler.get('CC')
+
+
+def peak_rss() -> int:
+    """
+    peak memory in bytes of the largest subprocess so far, over the life of the buildmc process
+    """
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+
+    rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+
+    return rss if sys.platform == 'darwin' else rss * 1024
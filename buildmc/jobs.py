@@ -0,0 +1,107 @@
+"""
+number of parallel jobs, capped so that the peak memory of concurrent compiles
+stays within a memory budget
+"""
+from pathlib import Path
+from typing import Dict
+import os
+import re
+import json
+import logging
+
+LOG_NAME = 'buildmc_launcher.jsonl'  # written by buildmc.launcher in build_dir
+DEFAULT_JOB_MEMORY = 1 << 30  # assumed peak memory of one compile before any are measured
+MAX_LOG_RECORDS = 10000  # launcher log records kept, most recent first
+
+UNITS = {'': 1, 'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30, 'T': 1 << 40}
+
+
+def get_meminfo(fn: Path = Path('/proc/meminfo')) -> Dict[str, int]:
+    """
+    Linux /proc/meminfo, in bytes
+    """
+    if not fn.is_file():
+        return {}
+
+    info = {}
+    for line in fn.read_text().splitlines():
+        name, _, value = line.partition(':')
+        fields = value.split()
+        if not fields:
+            continue
+        info[name] = int(fields[0]) * (1024 if fields[1:] == ['kB'] else 1)
+
+    return info
+
+
+def parse_size(size: str) -> int:
+    """
+    e.g. '16G', '512M', '200GB' => bytes
+    """
+    m = re.fullmatch(r'\s*(\d+(?:\.\d*)?)\s*([KMGT]?)(?:i?B)?\s*', str(size), re.IGNORECASE)
+    if not m:
+        raise ValueError(f'unknown size {size}')
+
+    return int(float(m.group(1)) * UNITS[m.group(2).upper()])
+
+
+def get_memory_budget(budget: str) -> int:
+    """
+    budget: 'auto' for the currently available memory, else a size like '16G'
+    """
+    if budget == 'auto':
+        avail = get_meminfo().get('MemAvailable')
+        if not avail:
+            logging.debug('available memory unknown on this platform')
+        return avail
+
+    return parse_size(budget)
+
+
+def peak_rss(log: Path) -> int:
+    """
+    largest peak RSS in bytes of any compile recorded by buildmc.launcher,
+    since the build directory was last wiped and among the most recent MAX_LOG_RECORDS compiles
+    """
+    if not log.is_file():
+        return 0
+
+    rss = 0
+    for line in log.read_text().splitlines():
+        try:
+            rec = json.loads(line)
+        except ValueError:  # line truncated by an interrupted compile
+            continue
+        if rec.get('kind') == 'compile':
+            rss = max(rss, rec['rss'])
+
+    return rss
+
+
+def trim_log(log: Path, max_records: int = MAX_LOG_RECORDS):
+    """
+    keep only the most recent records of the launcher log, so it does not grow without bound.
+    Not to be run while compiles may append to the log.
+    """
+    # records are about 70 bytes: skip reading logs that are certainly short enough
+    if not log.is_file() or log.stat().st_size < 50 * max_records:
+        return
+
+    lines = log.read_text().splitlines(keepends=True)
+    if len(lines) <= max_records:
+        return
+
+    tmp = log.with_name(log.name + '.tmp')
+    tmp.write_text(''.join(lines[-max_records:]))
+    os.replace(tmp, log)
+
+
+def max_jobs(budget: int, per_job: int, ncpu: int = None) -> int:
+
+    if not ncpu:
+        ncpu = os.cpu_count() or 1
+
+    if not budget or not per_job:
+        return ncpu
+
+    return max(1, min(ncpu, budget // per_job))
@@ -0,0 +1,60 @@
+"""
+compiler launcher recording the peak memory and duration of each compiler process.
+CMake runs it as CMAKE_<LANG>_COMPILER_LAUNCHER:
+
+    python buildmc/launcher.py log.jsonl cc -c foo.c -o foo.o
+
+and with "-kind link" as CMAKE_<LANG>_LINKER_LAUNCHER, recording also the link output.
+Meson runs it as a compiler wrapper given in CC etc., also for links, recorded as such.
+
+With -time_report, GCC -ftime-report output of compiles is saved as <object>.time-report.txt
+
+It is run as a script, so it must not import from buildmc.
+"""
+from argparse import ArgumentParser, REMAINDER
+from pathlib import Path
+import subprocess
+import resource
+import json
+import time
+import sys
+
+
+def main():
+    p = ArgumentParser()
+    p.add_argument('-kind', help='compile or link', default='compile')
+    p.add_argument('-time_report', help='save GCC -ftime-report of the compile', action='store_true')
+    p.add_argument('log', help='JSON lines file to append to')
+    p.add_argument('cmd', help='compiler command', nargs=REMAINDER)
+    P = p.parse_args()
+
+    tic = time.monotonic()
+    if P.time_report and '-c' in P.cmd and '-o' in P.cmd[:-1]:
+        ret = subprocess.run(P.cmd + ['-ftime-report'], stderr=subprocess.PIPE, universal_newlines=True)
+        # compiler messages come before the time report
+        msg, sep, report = ret.stderr.partition('Time variable')
+        if msg.strip():
+            sys.stderr.write(msg)
+        Path(P.cmd[P.cmd.index('-o') + 1] + '.time-report.txt').write_text(sep + report)
+    else:
+        ret = subprocess.run(P.cmd)
+    toc = time.monotonic()
+
+    # maximum over the process tree, since Linux carries a child's waited-for descendants up
+    rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    if sys.platform != 'darwin':  # kilobytes except on macOS
+        rss *= 1024
+
+    kind = 'link' if P.kind == 'link' or '-c' not in P.cmd else 'compile'
+    rec = {'kind': kind, 'rss': rss, 'seconds': round(toc - tic, 3), 'time': round(time.time(), 3)}
+    if kind == 'link' and '-o' in P.cmd[:-1]:
+        rec['output'] = P.cmd[P.cmd.index('-o') + 1]
+    # one short write per line with O_APPEND, so concurrent compiles don't interleave
+    with Path(P.log).open('a') as f:
+        f.write(json.dumps(rec) + '\n')
+
+    raise SystemExit(ret.returncode)
+
+
+if __name__ == '__main__':
+    main()
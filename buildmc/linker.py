@@ -0,0 +1,99 @@
+"""
+compare link times of the linkers available to the compiler.
+Changing the linker only relinks, so each linker is timed on the same object files.
+"""
+from pathlib import Path
+from typing import Any, Dict, List
+import pkg_resources
+import logging
+import json
+import time
+
+from .builder import Builder
+from .cmake import Cmake
+from .compilers import LINKERS, probe_linker
+from . import config
+from . import jobs
+
+
+def compare(B: Builder) -> str:
+    """
+    link the project with the compiler default linker and each available fast linker,
+    print link times, and save the fastest linker to buildmc.ini
+
+    CMAKE_<LANG>_LINKER_LAUNCHER  CMake >= 3.21
+    """
+    if not isinstance(B, Cmake) or B.version < pkg_resources.parse_version('3.21'):
+        raise ValueError('link time comparison requires CMake >= 3.21')
+
+    candidates = ['default'] + [ld for ld in LINKERS if probe_linker(B.compiler['CC'], ld, B.get_env())]
+    if len(candidates) == 1:
+        logging.warning(f'no other linker than the default available to {B.compiler["CC"]}')
+        return 'default'
+
+    do_test, install_dir, linker = B.do_test, B.install_dir, B.linker
+    B.do_test = B.install_dir = None
+    B.time_links = True
+    log = B.build_dir / jobs.LOG_NAME
+
+    links: Dict[str, List[Dict[str, Any]]] = {}
+    try:
+        # the first build compiles and may not relink; it is not timed
+        for i, ld in enumerate(candidates + candidates[:1]):
+            B.linker = None if ld == 'default' else ld
+            tic = time.time()
+            B.config()
+            if i > 0:
+                links[ld] = read_links(log, tic)
+    finally:
+        B.do_test, B.install_dir, B.linker = do_test, install_dir, linker
+        B.time_links = False
+
+    print_links(links)
+
+    best = fastest(links)
+    logging.info(f'fastest linker {best}, saving to {B.config_fn}')
+    config.set_linker(best, B.config_fn)
+    B.linker = None if best == 'default' else best
+
+    return best
+
+
+def fastest(links: Dict[str, List[Dict[str, Any]]]) -> str:
+    """
+    linker of the least total link time, of those that linked
+    """
+    timed = {ld: recs for ld, recs in links.items() if recs}
+    if not timed:
+        raise ValueError('no links were timed, as nothing was relinked')
+
+    return min(timed, key=lambda ld: sum(r['seconds'] for r in timed[ld]))
+
+
+def read_links(log: Path, since: float = 0) -> List[Dict[str, Any]]:
+    """
+    link records of the launcher log, of links ending at or after time "since"
+    """
+    if not log.is_file():
+        return []
+
+    recs = []
+    with log.open() as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue
+            if rec.get('kind') == 'link' and rec.get('time', 0) >= since:
+                recs.append(rec)
+
+    return recs
+
+
+def print_links(links: Dict[str, List[Dict[str, Any]]]):
+
+    print(f'{"linker":<8} {"links":>5} {"seconds":>8}  slowest')
+    for ld, recs in links.items():
+        slow = max(recs, key=lambda r: r['seconds'], default=None)
+        slowest = f'{Path(slow.get("output", "")).name} {slow["seconds"]:.2f}' if slow else ''
+        print(f'{ld:<8} {len(recs):>5} {sum(r["seconds"] for r in recs):8.2f}  {slowest}')
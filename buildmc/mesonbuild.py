@@ -1,17 +1,25 @@
-from typing import Dict,  List, Any
+from typing import Dict, List, Any
 from pathlib import Path
 import shutil
-import subprocess
-import os
+import shlex
 import json
 import logging
+import sys
+import os
 
-from .compilers import get_compiler
+from .builder import Builder
+from .compilers import get_vendor
+from . import changed
+from . import jobs
 
 LANGS = ['c', 'cpp', 'fortran']
+# "meson setup" built-in options given as flags without a value
+BOOLEAN_FLAGS = ('werror', 'strip', 'errorlogs', 'stdsplit')
+
 
+class Meson(Builder):
 
-class Meson():
+    build_system = 'meson'
 
     def __init__(self, params: Dict[str, Any] = {}, args: List[str] = []):
 
@@ -23,28 +31,13 @@ class Meson():
         if not self.ninja_exe:
             raise ImportError('Ninja executable not found')
 
-        source_dir = params.get('source_dir', Path.cwd())
-        if not source_dir:
-            source_dir = Path.cwd()
-        self.source_dir = Path(source_dir).expanduser().resolve()
-
-        build_dir = params.get('build_dir', self.source_dir / 'build')
-        if not build_dir:
-            build_dir = self.source_dir / 'build'
-        self.build_dir = Path(build_dir).expanduser().resolve()
-
-        self.install_dir = params.get('install_dir')
+        super().__init__(params, args)
 
-        self.do_test = params.get('do_test')
+        # linker for each language, read by "meson setup"
+        if self.linker:
+            self.compiler.update({'CC_LD': self.linker, 'CXX_LD': self.linker, 'FC_LD': self.linker})
 
-        self.vendor = params.get('vendor')
-
-        self.compiler, compiler_args = get_compiler(self.vendor)
-
-        self.args = args
-        self.args += compiler_args
-
-    def config(self, wipe: bool):
+    def config(self, wipe: bool = False):
         """
         attempt to build with Meson + Ninja
         """
@@ -54,31 +47,196 @@ class Meson():
         if not meson_build.is_file():
             raise FileNotFoundError(meson_build)
 
-        meson_setup = [self.meson_exe] + ['setup'] + self.args
+        setup_args = self.args + self.get_unity_args()
 
         if self.install_dir:
-            meson_setup.append('--prefix '+str(Path(self.install_dir).expanduser()))
+            setup_args += ['--prefix', str(Path(self.install_dir).expanduser())]
 
         wipe = self.needs_wipe(wipe)
-        if wipe:
-            meson_setup.append('--wipe')
-
-        meson_setup += [str(self.build_dir), str(self.source_dir)]
 
-        if wipe or not (self.build_dir / 'build.ninja').is_file():
-            subprocess.check_call(meson_setup, env=os.environ.update(self.compiler))
+        with self.phase('configure'):
+            if wipe or not (self.build_dir / 'build.ninja').is_file():
+                meson_setup = [self.meson_exe, 'setup'] + setup_args
+                if wipe and (self.build_dir / 'meson-private/coredata.dat').is_file():
+                    meson_setup.append('--wipe')
+                meson_setup += [str(self.build_dir), str(self.source_dir)]
+                self.runner.check_call(meson_setup, env=dict(self.get_env(), **self.get_launcher_env()))
+            else:
+                self.reconfigure(self.parse_options(setup_args))
+            self.save_flags()
 
         self.build_test()
 
         if self.install_dir:
-            subprocess.check_call([self.meson_exe, 'install', '-C', str(self.build_dir)])
+            with self.phase('install'):
+                self.runner.check_call([self.meson_exe, 'install', '-C', str(self.build_dir)])
+
+    def get_launcher_env(self) -> Dict[str, str]:
+        """
+        with a memory budget, compiles are run via buildmc.launcher to measure their peak memory,
+        and to save GCC time reports when profiling compiles.
+        Meson takes a compiler wrapper in CC etc. like "ccache gcc", read only by "meson setup".
+        """
+        time_report = ['-time_report'] if self.profile_compile and get_vendor(self.compiler) == 'gnu' else []
+        if not (self.memory_budget or time_report) or os.name == 'nt':
+            return {}
+
+        launcher = [sys.executable, str(Path(__file__).with_name('launcher.py'))] + time_report + \
+            [str(self.build_dir / jobs.LOG_NAME)]
+        wrapper = ' '.join(map(shlex.quote, launcher))
+        env = self.get_env()
+
+        return {k: f'{wrapper} {env[k]}' for k in ('CC', 'CXX', 'FC') if env.get(k)}
+
+    def reconfigure(self, options: Dict[str, str]):
+        """
+        apply only options that differ from those of the existing build directory,
+        instead of ignoring them or wiping the build directory
+        """
+        intro = self.build_dir / 'meson-info' / 'intro-buildoptions.json'
+        if not intro.is_file():
+            return
+
+        diff = self.diff_options(json.loads(intro.read_text()), options)
+        if not diff:
+            return
+
+        logging.info(f'Meson options changed: {diff}')
+        self.runner.check_call([self.meson_exe, 'configure', str(self.build_dir)] +
+                               [f'-D{k}={v}' for k, v in diff.items()])
+
+    @staticmethod
+    def parse_options(args: List[str]) -> Dict[str, str]:
+        """
+        options from "meson setup" arguments e.g. -Dfull=true --buildtype=release --prefix ~/foo
+        Built-in option names use underscores, e.g. --default-library => default_library
+        """
+        options: Dict[str, str] = {}
+
+        i = 0
+        while i < len(args):
+            arg = args[i]
+            i += 1
+            if arg.startswith('-D'):
+                name, _, value = arg[2:].partition('=')
+            elif arg.startswith('--'):
+                name, sep, value = arg[2:].partition('=')
+                name = name.replace('-', '_')
+                if name in BOOLEAN_FLAGS:
+                    value = 'true'
+                elif not sep:
+                    if i == len(args) or args[i].startswith('-'):
+                        continue
+                    value = args[i]
+                    i += 1
+            else:
+                continue
+
+            options[name] = value
+
+        return options
+
+    @staticmethod
+    def diff_options(current: List[Dict[str, Any]], options: Dict[str, str]) -> Dict[str, str]:
+        """
+        current: from meson-info/intro-buildoptions.json
+        options: requested options, from parse_options()
+        """
+        values = {opt['name']: opt['value'] for opt in current}
+
+        changed = {}
+        for name, value in options.items():
+            if name not in values:
+                logging.debug(f'{name} is not a Meson option of this build directory')
+                continue
+
+            cur = values[name]
+            if isinstance(cur, bool):
+                same = str(cur).lower() == value.lower()
+            elif isinstance(cur, int):
+                same = value.isdigit() and int(value) == cur
+            elif isinstance(cur, list):
+                same = [v.strip(' \'"') for v in value.strip('[]').split(',') if v.strip()] == cur
+            elif name == 'prefix':
+                same = Path(value).expanduser().resolve() == Path(cur).resolve()
+            else:
+                same = value == cur
+
+            if not same:
+                changed[name] = value
+
+        return changed
+
+    def get_unity_args(self) -> List[str]:
+        if not self.unity:
+            return []
+
+        unity = ['-Dunity=on']
+        if self.unity_size:
+            unity.append(f'-Dunity_size={self.unity_size}')
+
+        return unity
 
     def build_test(self):
 
-        if self.do_test:  # build and test
-            subprocess.check_call([self.meson_exe, 'test', '-C', str(self.build_dir)])
-        else:  # build only
-            subprocess.check_call([self.ninja_exe, '-C', str(self.build_dir)])
+        njobs = str(self.get_jobs())
+
+        build_cmd = [self.ninja_exe, '-C', str(self.build_dir), '-j', njobs]
+        test_cmd = [self.meson_exe, 'test', '-C', str(self.build_dir), '--no-rebuild', '--num-processes', njobs]
+
+        if self.changed_since:
+            targets = self.get_changed_targets()
+            if targets is not None:
+                if not targets:
+                    logging.info(f'no targets affected by changes since {self.changed_since}, skipping build')
+                    return
+                build_cmd += sorted(t['build'] for t in targets.values())
+                if self.do_test:
+                    tests = self.select_tests(targets)
+                    if not tests:
+                        logging.info('no tests use the affected targets')
+                    test_cmd = test_cmd + tests if tests else []
+
+        with self.phase('build'):
+            self.runner.check_call(build_cmd)
+
+        if self.do_test and test_cmd:
+            with self.phase('test'):
+                self.runner.check_call(test_cmd)
+
+    def get_changed_targets(self) -> Dict[str, Dict[str, Any]]:
+        """
+        targets affected by files changed since self.changed_since, or None for a full build
+        """
+        intro = self.build_dir / 'meson-info' / 'intro-targets.json'
+        if not intro.is_file():
+            return None
+
+        targets = changed.meson_targets(json.loads(intro.read_text()), self.build_dir)
+        changed.ninja_deps(targets, self.build_dir)
+
+        hit = changed.affected_targets(targets, changed.changed_files(self.source_dir, self.changed_since))
+        if hit is None:
+            return None
+
+        logging.info(f'targets affected by changes since {self.changed_since}: {sorted(hit)}')
+
+        return {name: targets[name] for name in hit}
+
+    def select_tests(self, targets: Dict[str, Dict[str, Any]]) -> List[str]:
+        """
+        tests depending on the affected targets, from meson-info/intro-tests.json
+        """
+        intro = self.build_dir / 'meson-info' / 'intro-tests.json'
+        alltargets = changed.meson_targets(
+            json.loads((self.build_dir / 'meson-info' / 'intro-targets.json').read_text()), self.build_dir)
+
+        tests = {}
+        for t in json.loads(intro.read_text()):
+            used = changed.tests_by_command({t['name']: t['cmd']}, alltargets)[t['name']]
+            tests[t['name']] = used | set(t.get('depends', []))
+
+        return changed.select_tests(tests, alltargets, set(targets))
 
     def needs_wipe(self, wipe: bool) -> bool:
         """
@@ -87,9 +245,11 @@ class Meson():
 
         if ((self.build_dir / 'meson-private/coredata.dat').is_file() and
                 not (self.build_dir / 'build.ninja').is_file()):
+            self.log_wipe('Meson build directory incomplete')
             return True
 
         if wipe:
+            self.log_wipe('wipe requested')
             return True
 
         cache_fn = self.build_dir / 'meson-info' / 'intro-targets.json'
@@ -100,15 +260,57 @@ class Meson():
         if self.check_compiler_cache(cache):
             return True
 
+        if self.flags_changed():
+            return True
+
+        if self.check_linker_cache():
+            return True
+
+        if self.check_launcher_cache():
+            return True
+
         return wipe
 
+    def check_launcher_cache(self) -> bool:
+        """
+        the compiler wrapper of get_launcher_env() is set only by "meson setup"
+        """
+        intro = self.build_dir / 'meson-info' / 'intro-compilers.json'
+        if not intro.is_file():
+            return False
+
+        launcher = str(Path(__file__).with_name('launcher.py'))
+        wrapped = any(launcher in c.get('exelist', []) for machine in json.loads(intro.read_text()).values()
+                      for c in machine.values())
+        if wrapped == bool(self.get_launcher_env()):
+            return False
+
+        self.log_wipe('compile memory measurement ' + ('disabled' if wrapped else 'enabled'))
+        return True
+
+    def check_linker_cache(self) -> bool:
+        """
+        the linker is chosen only by "meson setup"
+        """
+        intro = self.build_dir / 'meson-info' / 'intro-compilers.json'
+        if not self.linker or not intro.is_file():
+            return False
+
+        linkers = {c.get('linker_id') for machine in json.loads(intro.read_text()).values()
+                   for c in machine.values()}
+        if f'ld.{self.linker}' in linkers:
+            return False
+
+        self.log_wipe(f'Linker changes from {linkers} => {self.linker}')
+        return True
+
     def check_compiler_cache(self, cache: List[Dict[str, Any]]) -> bool:
         compilers = self.get_compiler_cache(cache)
 
         if set(compilers).intersection(self.compiler.values()):
             return False
 
-        logging.info(f'Compiler changes from {compilers} => {self.compiler}')
+        self.log_wipe(f'Compiler changes from {compilers} => {self.compiler}')
         return True
 
     @staticmethod
@@ -117,7 +319,7 @@ class Meson():
 
         for target in cache:
             for src in target['target_sources']:
-                if src['language'] in LANGS:
+                if src.get('language') in LANGS:
                     compilers += src['compiler']
 
         return compilers
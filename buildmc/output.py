@@ -0,0 +1,94 @@
+"""
+output of build commands, safe for several builds running concurrently in threads:
+
+* lines are written whole, optionally prefixed e.g. by project name
+* quiet: output is not shown, except the last lines of a failed command
+* optionally, the full output is saved compressed in a log directory, in one file per
+  prefix and buildmc run, e.g. proj-20240131-120000-1234.log.gz
+"""
+from pathlib import Path
+from typing import Dict, List, Set
+from collections import deque
+import subprocess
+import threading
+import gzip
+import time
+import sys
+import os
+import re
+
+_lock = threading.Lock()
+# names the logs of this buildmc run
+RUN_ID = time.strftime('%Y%m%d-%H%M%S') + f'-{os.getpid()}'
+# logs started by this run, to be appended to by later commands of the run
+_started: Set[Path] = set()
+
+
+def emit(lines: List[str]):
+    with _lock:
+        sys.stdout.write(''.join(lines))
+        sys.stdout.flush()
+
+
+class Runner():
+
+    def __init__(self, prefix: str = '', quiet: bool = False, log_dir: Path = None, tail: int = 200,
+                 env: Dict[str, str] = None):
+        """
+        tail: number of lines kept in memory, shown if a command fails in quiet mode
+        env: environment of commands not given one, instead of that of buildmc
+        """
+        self.prefix = f'[{prefix}] ' if prefix else ''
+        self.quiet = quiet
+        self.log = None
+        if log_dir:
+            log_dir = Path(log_dir).expanduser()
+            log_dir.mkdir(parents=True, exist_ok=True)
+            self.log = log_dir / (re.sub(r'[^\w.-]', '_', prefix or 'build') + f'-{RUN_ID}.log.gz')
+            with _lock:
+                if self.log not in _started:
+                    gzip.open(self.log, 'wb').close()
+                    _started.add(self.log)
+        self.tail = tail
+        self.env = env
+
+    def run(self, cmd: List[str], **kwargs) -> subprocess.CompletedProcess:
+        """
+        kwargs: passed to subprocess.Popen e.g. cwd, env
+        """
+        if self.env is not None:
+            kwargs.setdefault('env', self.env)
+
+        if not (self.prefix or self.quiet or self.log):  # direct to terminal, keeping color and progress lines
+            return subprocess.run(cmd, **kwargs)
+
+        ring: deque = deque(maxlen=self.tail)
+        header = '$ ' + ' '.join(map(str, cmd)) + '\n'
+
+        log = gzip.open(self.log, 'at', encoding='utf8') if self.log else None
+        try:
+            if log:
+                log.write(header)
+
+            proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, **kwargs)
+            for raw in proc.stdout:
+                line = self.prefix + raw.decode('utf8', errors='replace')
+                ring.append(line)
+                if log:
+                    log.write(line)
+                if not self.quiet:
+                    emit([line])
+            proc.wait()
+        finally:
+            if log:
+                log.close()
+
+        if proc.returncode and self.quiet:
+            emit([self.prefix + header] + list(ring))
+
+        return subprocess.CompletedProcess(cmd, proc.returncode)
+
+    def check_call(self, cmd: List[str], **kwargs):
+        ret = self.run(cmd, **kwargs)
+        if ret.returncode:
+            raise subprocess.CalledProcessError(ret.returncode, cmd)
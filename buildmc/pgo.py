@@ -0,0 +1,70 @@
+"""
+profile-guided optimization
+
+Raw profiles from the instrumented training run are merged and cached per compiler vendor
+and source fingerprint, so unchanged sources are not trained again.
+"""
+from pathlib import Path
+from typing import Any, Dict
+import os
+import subprocess
+import hashlib
+import shutil
+import json
+
+from . import config
+from .fingerprint import source_fingerprint
+
+
+def get_profile(source_dir: Path, build_dir: Path, vendor: str, compile_settings: Dict[str, Any]) -> Path:
+    """
+    path to the cached, merged profile: a directory for GCC and classic Intel, a .profdata file for Clang and icx
+    """
+    h = hashlib.sha256(json.dumps(compile_settings, sort_keys=True).encode())
+    h.update(source_fingerprint(source_dir, exclude=build_dir).encode())
+
+    profile = config.get_cache_dir() / 'pgo' / f'{vendor}-{h.hexdigest()[:16]}'
+    if vendor == 'clang':
+        profile = profile.with_suffix('.profdata')
+
+    return profile
+
+
+def find_profdata(cc: str = None, env: Dict[str, str] = None) -> str:
+    """
+    llvm-profdata of the same LLVM as compiler cc, e.g. in bin/compiler of Intel oneAPI, else from PATH
+    """
+    path = (env or os.environ).get('PATH')
+
+    if cc:
+        exe = shutil.which(cc, path=path)
+        if exe:
+            bindir = Path(exe).resolve().parent
+            found = shutil.which('llvm-profdata', path=os.pathsep.join((str(bindir), str(bindir / 'compiler'))))
+            if found:
+                return found
+
+    return shutil.which('llvm-profdata', path=path)
+
+
+def merge(vendor: str, raw_dir: Path, profile: Path, cc: str = None, env: Dict[str, str] = None):
+    """
+    merge raw profiles of the training run into the cached profile
+
+    cc, env: compiler and its environment, to find the matching llvm-profdata
+    """
+    raw = [f for f in raw_dir.rglob('*') if f.is_file()]
+    if not raw:
+        raise FileNotFoundError(f'training run wrote no profiles to {raw_dir}. Does the project have tests?')
+
+    profile.parent.mkdir(parents=True, exist_ok=True)
+
+    if vendor == 'clang':
+        profdata = find_profdata(cc, env)
+        if not profdata:
+            raise FileNotFoundError('llvm-profdata not found')
+        subprocess.check_call([profdata, 'merge', f'-output={profile}'] + [str(f) for f in raw])
+    else:  # GCC and classic Intel merge each run into the profile directory during training
+        if profile.is_dir():
+            shutil.rmtree(profile)
+        shutil.copytree(raw_dir, profile)
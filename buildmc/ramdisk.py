@@ -0,0 +1,85 @@
+"""
+build directories in RAM (tmpfs), for slow e.g. network file systems.
+
+The build directory is in the RAM disk, with a symlink from its usual location.
+Install outputs go to the install directory as usual; other files to keep, e.g. test logs, are copied
+after each build to a persistent "<build_dir>-artifacts" directory beside the symlink.
+A RAM disk is emptied on reboot, after which the next build is a clean build.
+"""
+from pathlib import Path
+from typing import List
+import hashlib
+import logging
+import shutil
+import os
+
+DEFAULT_ROOT = Path('/dev/shm')
+
+
+def get_root(root: str = None) -> Path:
+    """
+    RAM disk directory, or None if not available
+    """
+    if root:
+        return Path(root).expanduser()
+
+    if os.name != 'nt' and DEFAULT_ROOT.is_dir():
+        return DEFAULT_ROOT
+
+    return None
+
+
+def setup(build_dir: Path, source_dir: Path, root: Path) -> Path:
+    """
+    make build_dir a symlink to a directory in RAM disk root, named by project and build directory
+    so that each project configuration keeps its own RAM build directory.
+
+    Returns the RAM build directory.
+    """
+    key = hashlib.sha256(f'{source_dir}\n{build_dir}'.encode()).hexdigest()[:12]
+    ram_dir = root / f'buildmc-{source_dir.name}-{build_dir.name}-{key}'
+    ram_dir.mkdir(parents=True, exist_ok=True)
+
+    if build_dir.is_symlink():
+        if Path(os.readlink(str(build_dir))) == ram_dir:
+            return ram_dir
+        logging.info(f'{build_dir} pointed to {os.readlink(str(build_dir))}')
+        build_dir.unlink()
+    elif build_dir.is_dir():
+        if any(build_dir.iterdir()):
+            raise FileExistsError(f'{build_dir} is an existing build directory. '
+                                  'Remove it to build in RAM disk, or choose another build directory.')
+        build_dir.rmdir()
+
+    build_dir.parent.mkdir(parents=True, exist_ok=True)
+    build_dir.symlink_to(ram_dir, target_is_directory=True)
+    logging.info(f'building in RAM disk {ram_dir}')
+
+    return ram_dir
+
+
+def sync(ram_dir: Path, dest: Path, patterns: List[str]) -> int:
+    """
+    copy files matching glob patterns, relative to ram_dir, that are new or changed to dest.
+
+    Returns number of files copied.
+    """
+    n = 0
+    for pat in patterns:
+        for f in ram_dir.glob(pat):
+            if not f.is_file():
+                continue
+            out = dest / f.relative_to(ram_dir)
+            st = f.stat()
+            if out.is_file():
+                ost = out.stat()
+                if ost.st_size == st.st_size and ost.st_mtime_ns == st.st_mtime_ns:
+                    continue
+            out.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copy2(f, out)
+            n += 1
+
+    if n:
+        logging.info(f'copied {n} files from RAM disk to {dest}')
+
+    return n
@@ -0,0 +1,170 @@
+"""
+registry of the build directories buildmc has configured, in the build history database,
+to reclaim disk space by removing the least recently used build directories
+"""
+from pathlib import Path
+from typing import Any, Dict, List
+import sqlite3
+import logging
+import shutil
+import json
+import time
+import os
+
+from .builder import Builder
+from . import history
+
+SCHEMA = """CREATE TABLE IF NOT EXISTS build_dirs (
+    build_dir TEXT PRIMARY KEY,
+    source_dir TEXT,
+    build_system TEXT,
+    compiler TEXT,
+    size INTEGER,
+    sized REAL,
+    last_used REAL)"""
+
+# a directory is removed only if it has one of these, so that it is certainly a build directory
+MARKERS = ('CMakeCache.txt', 'meson-private/coredata.dat', '.buildmc_make.json')
+
+
+def connect(db: Path = None) -> sqlite3.Connection:
+    conn = history.connect(db)
+    conn.execute(SCHEMA)
+
+    return conn
+
+
+def register(B: Builder, db: Path = None):
+    """
+    record use of the build directory of Builder B. Its size is measured later, by gc().
+    """
+    with connect(db) as conn:
+        conn.execute('INSERT OR REPLACE INTO build_dirs (build_dir, source_dir, build_system, compiler, last_used) '
+                     'VALUES (?,?,?,?,?)',
+                     (str(B.build_dir), str(B.source_dir), B.build_system, json.dumps(B.compiler), time.time()))
+    conn.close()
+
+
+def get_dirs(db: Path = None) -> List[Dict[str, Any]]:
+    """
+    registered build directories, least recently used first, with sizes updated
+    for those used since last measured. Directories no longer existing are unregistered.
+
+    Build directories inside another, e.g. <build_dir>/release of a build profile, are not counted
+    in the size of the outer directory.
+    """
+    conn = connect(db)
+    rows = [dict(r) for r in conn.execute('SELECT * FROM build_dirs ORDER BY last_used').fetchall()]
+    rows = [r for r in rows if Path(r['build_dir']).is_dir()]
+
+    dirs = []
+    with conn:
+        conn.execute(f'DELETE FROM build_dirs WHERE build_dir NOT IN ({",".join("?" * len(rows))})',
+                     [r['build_dir'] for r in rows])
+        for r in rows:
+            path = Path(r['build_dir'])
+            inner = [c for c in rows if path in Path(c['build_dir']).parents]
+            if (r['size'] is None or r['sized'] < r['last_used'] or
+                    any(c['last_used'] > r['sized'] for c in inner)):
+                r['size'], r['sized'] = dir_size(path, [Path(c['build_dir']) for c in inner]), time.time()
+                conn.execute('UPDATE build_dirs SET size = ?, sized = ? WHERE build_dir = ?',
+                             (r['size'], r['sized'], r['build_dir']))
+            r['compiler'] = json.loads(r['compiler'])
+            dirs.append(r)
+    conn.close()
+
+    return dirs
+
+
+def dir_size(path: Path, exclude: List[Path] = []) -> int:
+    """
+    disk space used by the files under path, not following symlinks, and not under the exclude directories
+    """
+    skip = {str(p) for p in exclude}
+
+    size = 0
+    for root, subdirs, files in os.walk(path):
+        subdirs[:] = [d for d in subdirs if os.path.join(root, d) not in skip]
+        for f in files:
+            try:
+                st = os.lstat(os.path.join(root, f))
+            except OSError:
+                continue
+            size += st.st_blocks * 512 if hasattr(st, 'st_blocks') else st.st_size
+
+    return size
+
+
+def remove(path: Path, keep: List[Path]):
+    """
+    remove directory path, except the keep directories inside it
+    """
+    if not any(path in k.parents for k in keep):
+        shutil.rmtree(path, ignore_errors=True)
+        return
+
+    for p in path.iterdir():
+        if p in keep:
+            continue
+        if p.is_dir() and not p.is_symlink():
+            remove(p, keep)
+        else:
+            p.unlink()
+
+
+def is_build_dir(path: Path, source_dir: Path) -> bool:
+    """
+    a build directory buildmc can safely remove: with a build system marker file, and not containing
+    the source directory
+    """
+    path = path.resolve()
+    if path == source_dir.resolve() or path in source_dir.resolve().parents:
+        return False
+
+    return any((path / m).is_file() for m in MARKERS)
+
+
+def gc(max_size: int, db: Path = None, dry_run: bool = False) -> List[Dict[str, Any]]:
+    """
+    remove least recently used build directories until the registered build directories
+    use at most max_size bytes.
+
+    Returns the build directories removed, or to be removed if dry_run.
+    Of a build directory containing others that are kept, only its own files are removed.
+    """
+    dirs = get_dirs(db)
+    total = sum(d['size'] for d in dirs)
+
+    evict = []
+    for d in dirs:
+        if total <= max_size:
+            break
+        path = Path(d['build_dir'])
+        if not is_build_dir(path, Path(d['source_dir'])):
+            logging.warning(f'{path} does not look like a build directory, not removing')
+            continue
+        evict.append(d)
+        total -= d['size']
+
+    if dry_run:
+        return evict
+
+    conn = connect(db)
+    with conn:
+        for i, d in enumerate(evict):
+            logging.info(f'removing {d["build_dir"]}  {d["size"] >> 20} MB')
+            # build directories inside this one, used more recently, are kept
+            kept = [Path(k['build_dir']) for k in dirs if k not in evict[:i + 1]]
+            remove(Path(d['build_dir']), kept)
+            conn.execute('DELETE FROM build_dirs WHERE build_dir = ?', (d['build_dir'],))
+    conn.close()
+
+    return evict
+
+
+def print_dirs(dirs: List[Dict[str, Any]]):
+
+    print(f'{"last used":<17} {"MB":>8} {"system":<6} {"CC":<8} build_dir')
+    for d in dirs:
+        print(f'{time.strftime("%Y-%m-%d %H:%M", time.localtime(d["last_used"])):<17} {d["size"] >> 20:8d} '
+              f'{d["build_system"]:<6} {d["compiler"].get("CC", ""):<8} {d["build_dir"]}')
@@ -0,0 +1,227 @@
+"""
+resource use of the build, sampled from /proc (Linux) at a fixed interval in a background thread:
+CPU utilization, memory (RSS), I/O and number of compiler processes of all processes started by buildmc.
+
+The CPU time and I/O of the process tree are the counters of the live descendant processes plus the
+"children" counters of buildmc itself, which the kernel adds exited processes to when they are reaped.
+"""
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+import threading
+import logging
+import json
+import time
+import os
+
+TIMELINE_NAME = 'buildmc_timeline.jsonl'
+PROC = Path('/proc')
+
+COMPILERS = ('cc1', 'cc1plus', 'cc1obj', 'f951', 'lto1', 'clang', 'flang', 'icx', 'icpx', 'ifx', 'icc', 'icpc',
+             'ifort', 'mcpcom', 'nvc', 'nvfortran', 'pgc', 'pgf', 'cicc', 'ptxas')
+# utilization below this fraction of the CPU cores at the end of the build phase is the idle tail
+TAIL_UTILIZATION = 0.5
+
+Sample = Dict[str, Any]
+
+
+def read_stat(pid: int) -> Tuple[str, int, float, int]:
+    """
+    command name, parent PID, CPU seconds including reaped children, RSS bytes
+    """
+    text = (PROC / str(pid) / 'stat').read_text()
+    comm = text[text.index('(') + 1:text.rindex(')')]
+    f = text[text.rindex(')') + 2:].split()
+
+    cpu = sum(int(x) for x in f[11:15]) / os.sysconf('SC_CLK_TCK')
+
+    return comm, int(f[1]), cpu, int(f[21]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def read_io(pid: int) -> Dict[str, int]:
+    """
+    I/O of the process and its reaped children. Unavailable without I/O accounting or permission.
+    """
+    try:
+        lines = (PROC / str(pid) / 'io').read_text().splitlines()
+    except OSError:
+        return {}
+
+    io = {}
+    for line in lines:
+        k, _, v = line.partition(':')
+        io[k] = int(v)
+
+    return io
+
+
+def descendants(pid: int) -> List[int]:
+    """
+    PIDs of the process tree under pid, by /proc/<pid>/task/<tid>/children if the kernel has it,
+    else by the parent PID of every process
+    """
+    tasks = list((PROC / str(pid) / 'task').glob('*/children'))
+    if tasks:
+        found: List[int] = []
+        todo = [pid]
+        while todo:
+            p = todo.pop()
+            for fn in (PROC / str(p) / 'task').glob('*/children'):
+                try:
+                    kids = [int(k) for k in fn.read_text().split()]
+                except OSError:
+                    continue
+                found += kids
+                todo += kids
+        return found
+
+    children: Dict[int, List[int]] = {}
+    for d in PROC.iterdir():
+        if not d.name.isdigit():
+            continue
+        try:
+            ppid = read_stat(int(d.name))[1]
+        except (OSError, ValueError, IndexError):
+            continue
+        children.setdefault(ppid, []).append(int(d.name))
+
+    found = []
+    todo = [pid]
+    while todo:
+        kids = children.get(todo.pop(), [])
+        found += kids
+        todo += kids
+
+    return found
+
+
+class Sampler(threading.Thread):
+
+    def __init__(self, interval: float = 0.5, phase: Callable[[], str] = None):
+        """
+        phase: returns the build phase, e.g. "build", recorded with each sample
+        """
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.phase = phase
+        self.samples: List[Sample] = []
+        self._stop_event = threading.Event()
+        self.pid = os.getpid()
+
+    @staticmethod
+    def available() -> bool:
+        return (PROC / 'self' / 'stat').is_file()
+
+    def run(self):
+        base = self.totals()
+        while not self._stop_event.wait(self.interval):
+            try:
+                s = self.sample(base)
+            except OSError as e:
+                logging.debug(f'resource sample failed: {e}')
+                continue
+            self.samples.append(s)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def totals(self) -> Dict[str, float]:
+        """
+        cumulative CPU seconds and I/O of the process tree, and its current RSS and compiler processes
+        """
+        # reaped children, not buildmc itself
+        t = os.times()
+        io = read_io(self.pid)
+        tot = {'cpu': t.children_user + t.children_system, 'rss': 0, 'compilers': 0,
+               'read': io.get('read_bytes', 0), 'write': io.get('write_bytes', 0),
+               'rchar': io.get('rchar', 0), 'wchar': io.get('wchar', 0)}
+
+        for pid in descendants(self.pid):
+            try:
+                comm, _, cpu, rss = read_stat(pid)
+            except (OSError, ValueError, IndexError):  # process exited
+                continue
+            io = read_io(pid)
+            tot['cpu'] += cpu
+            tot['rss'] += rss
+            tot['compilers'] += comm.startswith(COMPILERS)
+            tot['read'] += io.get('read_bytes', 0)
+            tot['write'] += io.get('write_bytes', 0)
+            tot['rchar'] += io.get('rchar', 0)
+            tot['wchar'] += io.get('wchar', 0)
+
+        tot['time'] = time.monotonic()
+
+        return tot
+
+    def sample(self, base: Dict[str, float]) -> Sample:
+        tot = self.totals()
+        prev = self.samples[-1] if self.samples else None
+
+        s: Sample = {'t': round(tot['time'] - base['time'], 3),
+                     'phase': self.phase() if self.phase else '',
+                     'rss': tot['rss'],
+                     'compilers': tot['compilers']}
+        for k in ('cpu', 'read', 'write', 'rchar', 'wchar'):
+            s[k] = tot[k] - base[k]
+
+        dt = s['t'] - (prev['t'] if prev else 0)
+        s['cores'] = round((s['cpu'] - (prev['cpu'] if prev else 0)) / dt, 2) if dt > 0 else 0.
+
+        return s
+
+    def write(self, fn: Path):
+        with fn.open('w') as f:
+            for s in self.samples:
+                f.write(json.dumps(s) + '\n')
+
+
+def summarize(samples: List[Sample], ncpu: int = None) -> Dict[str, Any]:
+    """
+    average utilization of the CPU cores, idle tail of the build phase, peak memory and I/O
+    """
+    if not ncpu:
+        ncpu = os.cpu_count() or 1
+
+    summary: Dict[str, Any] = {'cores': ncpu, 'phases': {}}
+    if not samples:
+        return summary
+
+    start = 0.
+    for s in samples:
+        ph = summary['phases'].setdefault(s['phase'], {'seconds': 0., 'cpu': 0.})
+        ph['seconds'] += s['t'] - start
+        ph['cpu'] += s['cores'] * (s['t'] - start)
+        start = s['t']
+    for ph in summary['phases'].values():
+        ph['utilization'] = ph['cpu'] / ph['seconds'] / ncpu if ph['seconds'] else 0.
+
+    summary['utilization'] = samples[-1]['cpu'] / samples[-1]['t'] / ncpu if samples[-1]['t'] else 0.
+    summary['peak_rss'] = max(s['rss'] for s in samples)
+    summary['max_compilers'] = max(s['compilers'] for s in samples)
+    summary['read'] = samples[-1]['read']
+    summary['write'] = samples[-1]['write']
+
+    # time at the end of the build phase with most cores idle, e.g. waiting on one large file or link
+    build = [s for s in samples if s['phase'] == 'build']
+    tail = 0.
+    for prev, s in zip(reversed(build[:-1]), reversed(build)):
+        if s['cores'] >= TAIL_UTILIZATION * ncpu:
+            break
+        tail += s['t'] - prev['t']
+    summary['idle_tail'] = tail
+
+    return summary
+
+
+def print_summary(summary: Dict[str, Any]):
+    if 'peak_rss' not in summary:
+        return
+
+    print(f'CPU utilization {summary["utilization"]:.0%} of {summary["cores"]} cores; ' +
+          ', '.join(f'{name} {ph["utilization"]:.0%} over {ph["seconds"]:.1f} s'
+                    for name, ph in summary['phases'].items() if name))
+    print(f'idle tail of build {summary["idle_tail"]:.1f} s, '
+          f'peak memory {summary["peak_rss"] / 2**30:.2f} GB, '
+          f'up to {summary["max_compilers"]} compiler processes, '
+          f'disk read {summary["read"] / 2**20:.0f} MB, write {summary["write"] / 2**20:.0f} MB')
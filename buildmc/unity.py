@@ -0,0 +1,45 @@
+"""
+unity (jumbo) builds compile several source files per translation unit,
+parsing common headers once per batch instead of once per source file.
+"""
+from typing import Dict, Sequence, Union
+import logging
+import time
+
+from .builder import Builder
+from .cmake import Cmake
+from .mesonbuild import Meson
+from . import config
+
+SIZES = (4, 8, 16, 32)
+
+
+def tune(B: Union[Builder, Cmake, Meson], sizes: Sequence[int] = SIZES) -> int:
+    """
+    time a clean build of the project for each unity batch size,
+    and save the fastest batch size to buildmc.ini
+    """
+    if not isinstance(B, (Cmake, Meson)):
+        raise ValueError('unity build requires CMake or Meson')
+
+    do_test, install_dir = B.do_test, B.install_dir
+    B.do_test = B.install_dir = None
+    B.unity = True
+
+    times: Dict[int, float] = {}
+    try:
+        for size in sizes:
+            B.unity_size = size
+            tic = time.monotonic()
+            B.config(wipe=True)
+            times[size] = time.monotonic() - tic
+            logging.info(f'unity batch size {size}: clean build {times[size]:.1f} seconds')
+    finally:
+        B.do_test, B.install_dir = do_test, install_dir
+
+    best = min(times, key=times.get)
+    logging.info(f'fastest unity batch size {best}, saving to {B.config_fn}')
+    config.set_unity_size(best, B.config_fn)
+    B.unity_size = best
+
+    return best
@@ -0,0 +1,163 @@
+"""
+environment of compiler vendor scripts e.g. Intel oneAPI setvars.sh or classic compilervars.sh,
+sourced once and cached, so the compilers work without sourcing the script in each shell.
+
+The cache holds the variables the script sets, relative to the environment it was sourced from:
+for path lists e.g. PATH only the entries added, so they apply on top of the current environment.
+Cache entries are per script and arguments, and are redone when the script modification time changes.
+"""
+from pathlib import Path
+from typing import Dict, List
+import subprocess
+import logging
+import hashlib
+import shutil
+import shlex
+import json
+import sys
+import os
+
+from . import config
+
+SCRIPTS = {'intel': {'posix': ['/opt/intel/oneapi/setvars.sh', '~/intel/oneapi/setvars.sh',
+                               '/opt/intel/bin/compilervars.sh', '~/intel/bin/compilervars.sh'],
+                     'nt': [r'%ProgramFiles(x86)%\Intel\oneAPI\setvars.bat',
+                            r'%ProgramFiles(x86)%\IntelSWTools\compilers_and_libraries\windows\bin\compilervars.bat']}}
+ARGS = {'intel': ['intel64']}
+# set by the vendor script: its environment is already active
+ACTIVE = {'intel': ('SETVARS_COMPLETED', 'MKLROOT')}
+
+# variables that are path lists even if the script creates them
+PATH_VARS = ('PATH', 'LD_LIBRARY_PATH', 'LIBRARY_PATH', 'DYLD_LIBRARY_PATH', 'CPATH', 'C_INCLUDE_PATH',
+             'CPLUS_INCLUDE_PATH', 'PKG_CONFIG_PATH', 'CMAKE_PREFIX_PATH', 'MANPATH', 'NLSPATH', 'CLASSPATH',
+             'PYTHONPATH', 'INCLUDE', 'LIB', 'LIBPATH')
+
+DUMP = 'import json, os; print(json.dumps(dict(os.environ)))'
+
+Diff = Dict[str, Dict[str, str]]
+
+
+def find_script(vendor: str, cfgfn: Path = None) -> Path:
+    """
+    environment script of the vendor from buildmc.ini "<vendor>_env", else from the default install locations
+    """
+    script = config.get_vendor_env(vendor, cfgfn)
+    if script:
+        path = Path(script).expanduser()
+        if path.is_file():
+            return path
+        logging.warning(f'{vendor} environment script {path} not found')
+        return None
+
+    for s in SCRIPTS.get(vendor, {}).get(os.name, []):
+        path = Path(os.path.expandvars(s)).expanduser()
+        if path.is_file():
+            return path
+
+    return None
+
+
+def capture(script: Path = None, args: List[str] = []) -> Dict[str, str]:
+    """
+    environment of the shell after sourcing script with args, or of the shell alone if script is None
+    """
+    if os.name == 'nt':
+        cmd = f'"{sys.executable}" -c "{DUMP}"'
+        if script:
+            cmd = f'call "{script}" {" ".join(args)} >nul 2>&1 && ' + cmd
+        ret = subprocess.run(['cmd', '/d', '/c', cmd], stdout=subprocess.PIPE, universal_newlines=True)
+    else:
+        bash = shutil.which('bash')
+        if not bash:
+            raise FileNotFoundError('bash is needed to source the compiler environment script')
+        cmd = f'"$0" -c "{DUMP}"'
+        if script:
+            cmd = f'. {shlex.quote(str(script))} {" ".join(map(shlex.quote, args))} > /dev/null 2>&1 && ' + cmd
+        # stdin closed, as some scripts prompt when interactive
+        ret = subprocess.run([bash, '-c', cmd, sys.executable], stdin=subprocess.DEVNULL,
+                             stdout=subprocess.PIPE, universal_newlines=True)
+
+    if ret.returncode:
+        raise subprocess.CalledProcessError(ret.returncode, str(script))
+
+    return json.loads(ret.stdout.strip().splitlines()[-1])
+
+
+def env_diff(before: Dict[str, str], after: Dict[str, str]) -> Diff:
+    """
+    variables set by the script, and entries prepended or appended to path lists
+    """
+    diff: Diff = {'set': {}, 'prepend': {}, 'append': {}}
+
+    for k, v in after.items():
+        old = before.get(k)
+        if v == old:
+            continue
+        if old and v.endswith(os.pathsep + old):
+            diff['prepend'][k] = v[:-len(old)]
+        elif old and v.startswith(old + os.pathsep):
+            diff['append'][k] = v[len(old):]
+        elif not old and k.upper() in PATH_VARS:
+            diff['prepend'][k] = v.strip(os.pathsep) + os.pathsep
+        else:
+            diff['set'][k] = v
+
+    return diff
+
+
+def apply(diff: Diff, environ: Dict[str, str] = None) -> Dict[str, str]:
+    """
+    variables to set on top of environ (default os.environ)
+    """
+    if environ is None:
+        environ = dict(os.environ)
+
+    env = dict(diff['set'])
+    for k, v in diff['prepend'].items():
+        cur = environ.get(k)
+        env[k] = v + cur if cur else v.rstrip(os.pathsep)
+    for k, v in diff['append'].items():
+        cur = environ.get(k)
+        env[k] = cur + v if cur else v.lstrip(os.pathsep)
+
+    return env
+
+
+def load(script: Path, args: List[str]) -> Diff:
+    """
+    environment diff of script, from the cache if the script is unchanged
+    """
+    key = hashlib.sha256(json.dumps([str(script.resolve()), args]).encode()).hexdigest()[:16]
+    cache_fn = config.get_cache_dir() / 'env' / f'{key}.json'
+    mtime = script.stat().st_mtime_ns
+
+    cache = config.read_json(cache_fn)
+    if cache.get('mtime') == mtime:
+        return cache['diff']
+
+    logging.info(f'sourcing {script}')
+    # the shell alone sets some variables e.g. SHLVL, so compare with the same shell without the script
+    diff = env_diff(capture(), capture(script, args))
+
+    config.update_json(cache_fn, {'script': str(script), 'args': args, 'mtime': mtime, 'diff': diff})
+
+    return diff
+
+
+def activate(vendor: str, cfgfn: Path = None) -> Dict[str, str]:
+    """
+    environment variables for the compilers of vendor, empty if the vendor has no environment script,
+    its environment is already active, or the script is not found
+    """
+    if vendor not in SCRIPTS or any(os.environ.get(v) for v in ACTIVE.get(vendor, ())):
+        return {}
+
+    script = find_script(vendor, cfgfn)
+    if not script:
+        return {}
+
+    try:
+        return apply(load(script, ARGS.get(vendor, [])))
+    except (OSError, ValueError, subprocess.CalledProcessError) as e:
+        logging.warning(f'could not source {script}: {e}')
+        return {}
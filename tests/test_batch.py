@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+import pytest
+import threading
+import time
+
+import buildmc.batch as batch
+
+
+def make_projects(tmp_path):
+    """
+    app needs lib1 and lib2, lib2 needs lib1
+    """
+    libs = {'lib1': [], 'lib2': ['lib1'], 'app': ['lib1', 'lib2']}
+
+    manifest = tmp_path / 'manifest.ini'
+    text = ''
+    for name, needs in libs.items():
+        src = tmp_path / 'src' / name
+        src.mkdir(parents=True)
+        (src / 'main.c').write_text(f'int {name}(void) {{ return 0; }}\n')
+        lines = ''.join(f'\n  {n} {tmp_path / "install" / n}' for n in needs)
+        (src / 'buildmc.ini').write_text(f'[buildmc]\nlibrary:{lines}\n')
+        text += f'[{name}]\nsource_dir: {src}\ninstall_dir: {tmp_path / "install" / name}\n\n'
+    manifest.write_text(text)
+
+    return manifest
+
+
+def test_deps(tmp_path):
+    projects = batch.read_manifest(make_projects(tmp_path))
+
+    assert batch.get_deps(projects) == {'lib1': set(), 'lib2': {'lib1'}, 'app': {'lib1', 'lib2'}}
+
+    with pytest.raises(ValueError):
+        batch.check_cycles({'a': {'b'}, 'b': {'a'}, 'c': set()})
+
+
+def test_build_all(tmp_path):
+    projects = batch.read_manifest(make_projects(tmp_path))
+    state_fn = tmp_path / 'state.json'
+    order = []
+    lock = threading.Lock()
+
+    def build(name, project, jobs):
+        time.sleep(0.01)
+        with lock:
+            order.append((name, jobs))
+
+    status = batch.build_all(projects, 4, build, state_fn)
+    assert status == {'lib1': 'built', 'lib2': 'built', 'app': 'built'}
+    assert order == [('lib1', 4), ('lib2', 4), ('app', 4)]
+
+    # unchanged projects are skipped, and a change rebuilds dependent projects
+    (tmp_path / 'src' / 'lib2' / 'main.c').write_text('int lib2(void) { return 1; }\n')
+    order.clear()
+    status = batch.build_all(projects, 4, build, state_fn)
+    assert status == {'lib1': 'unchanged', 'lib2': 'built', 'app': 'built'}
+
+
+def test_share_cores(tmp_path):
+    projects = {}
+    for name in ('a', 'b'):
+        (tmp_path / name).mkdir()
+        projects[name] = {'source_dir': tmp_path / name, 'args': []}
+    jobs = {}
+
+    def build(name, project, j):
+        jobs[name] = j
+
+    state_fn = tmp_path / 'state.json'
+    batch.build_all(projects, 5, build, state_fn)
+    assert jobs == {'a': 2, 'b': 3}
+
+    # cores are shared only among the projects that changed
+    (tmp_path / 'a' / 'main.c').write_text('int a;\n')
+    jobs.clear()
+    batch.build_all(projects, 5, build, state_fn)
+    assert jobs == {'a': 5}
+
+
+def test_failed(tmp_path):
+    projects = batch.read_manifest(make_projects(tmp_path))
+
+    def build(name, project, jobs):
+        if name == 'lib2':
+            raise SystemExit('build failed')
+
+    status = batch.build_all(projects, 2, build)
+    assert status == {'lib1': 'built', 'lib2': 'failed', 'app': 'blocked'}
+
+
+if __name__ == '__main__':
+    pytest.main(['-x', __file__])
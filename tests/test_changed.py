@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+import pytest
+from pathlib import Path
+
+import buildmc.changed as changed
+
+
+def make_targets(src: Path):
+    """
+    exe a links library foo, exe b is independent
+    """
+    return {'foo': {'sources': {src / 'foo.c'}, 'deps': set(), 'artifacts': {src / 'libfoo.a'}, 'build': 'foo'},
+            'a': {'sources': {src / 'a.c'}, 'deps': {'foo'}, 'artifacts': {src / 'a'}, 'build': 'a'},
+            'b': {'sources': {src / 'b.c'}, 'deps': set(), 'artifacts': {src / 'b'}, 'build': 'b'}}
+
+
+def test_affected(tmp_path):
+    targets = make_targets(tmp_path)
+
+    assert changed.affected_targets(targets, [tmp_path / 'b.c']) == {'b'}
+    assert changed.affected_targets(targets, [tmp_path / 'foo.c']) == {'foo', 'a'}
+    assert changed.affected_targets(targets, [tmp_path / 'README.md']) == set()
+    assert changed.affected_targets(targets, [tmp_path / 'CMakeLists.txt']) is None
+    assert changed.affected_targets(targets, [tmp_path / 'foo.h']) is None
+
+    tests = changed.tests_by_command({'ta': [str(tmp_path / 'a')], 'tb': [str(tmp_path / 'b'), '-v'],
+                                      'script': ['python', 'check.py']}, targets)
+    assert tests == {'ta': {'a'}, 'tb': {'b'}, 'script': set()}
+    assert changed.select_tests(tests, targets, {'foo', 'a'}) == ['ta', 'script']
+    assert changed.select_tests(tests, targets, set()) == []
+
+
+def test_header_deps(tmp_path):
+    targets = make_targets(tmp_path)
+    deps = ("a.o: #deps 3, deps mtime 1 (VALID)\n"
+            f"    {tmp_path / 'a.c'}\n"
+            "    ../foo.h\n"
+            "    /usr/include/stdio.h\n\n"
+            "b.o: #deps 1, deps mtime 1 (VALID)\n"
+            f"    {tmp_path / 'b.c'}\n")
+
+    changed.add_header_deps(targets, tmp_path / 'build', deps)
+
+    assert changed.affected_targets(targets, [tmp_path / 'foo.h']) == {'a'}
+
+
+def test_meson_targets(tmp_path):
+    build_dir = tmp_path / 'build'
+    intro = [{'id': 'foo@sta', 'filename': [str(build_dir / 'libfoo.a')],
+              'target_sources': [{'language': 'c', 'sources': [str(tmp_path / 'foo.c')]},
+                                 {'linker': ['ar'], 'parameters': []}]},
+             {'id': 'a@exe', 'filename': [str(build_dir / 'a')],
+              'target_sources': [{'language': 'c', 'sources': [str(tmp_path / 'a.c')]},
+                                 {'linker': ['cc'], 'parameters': ['-Wl,--as-needed', 'libfoo.a']}]}]
+
+    targets = changed.meson_targets(intro, build_dir)
+
+    assert targets['a@exe']['deps'] == {'foo@sta'}
+    assert targets['foo@sta']['build'] == 'libfoo.a'
+    assert changed.affected_targets(targets, [tmp_path / 'foo.c']) == {'foo@sta', 'a@exe'}
+
+
+if __name__ == '__main__':
+    pytest.main(['-x', __file__])
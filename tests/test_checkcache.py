@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import pytest
+
+import buildmc.checkcache as cc
+
+R = Path(__file__).parent
+
+CACHE = """# This is the CMakeCache file.
+//Path to a library.
+M_LIBRARY:FILEPATH={libm}
+Z_LIBRARY:FILEPATH=Z_LIBRARY-NOTFOUND
+CMAKE_C_COMPILER:FILEPATH=/usr/bin/gcc
+CMAKE_Fortran_COMPILER:FILEPATH=CMAKE_Fortran_COMPILER-NOTFOUND
+# INTERNAL cache entries
+C_OK_COMPILES:INTERNAL=1
+C_BAD_COMPILES:INTERNAL=
+C_OK_EXITCODE:INTERNAL=0
+C_BAD_EXITCODE:INTERNAL=1
+HAVE_NONEXIST_H:INTERNAL=
+HAVE_STDIO_H:INTERNAL=1
+CMAKE_CACHEFILE_DIR:INTERNAL=/build
+"""
+
+
+def test_checks(tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'cache'))
+
+    libm = tmp_path / 'libm.so'
+    libm.touch()
+
+    build_dir = tmp_path / 'build'
+    build_dir.mkdir()
+    (build_dir / 'CMakeCache.txt').write_text(CACHE.format(libm=libm.as_posix()))
+
+    cache = cc.read_cache(build_dir / 'CMakeCache.txt')
+    assert cache['HAVE_NONEXIST_H'] == ('INTERNAL', '')
+
+    checks = cc.get_checks(cache)
+    # failed checks are not saved
+    assert set(checks) == {'C_OK_COMPILES', 'C_OK_EXITCODE', 'HAVE_STDIO_H', 'CMAKE_C_COMPILER_WORKS'}
+
+    assert set(cc.get_lib_results(cache, 'm')) == {'M_LIBRARY'}
+    assert not cc.get_lib_results(cache, 'z')
+
+    assert cc.write_init(tmp_path / 'new', R, 'abc', {}) is None
+
+    cc.save_results(build_dir, R, 'abc', {'m': '/usr'})
+
+    init = cc.write_init(tmp_path / 'new', R, 'abc', {'m': '/usr'}).read_text()
+    assert 'set(HAVE_STDIO_H "1" CACHE INTERNAL "")' in init
+    assert 'HAVE_NONEXIST_H' not in init
+    assert f'set(M_LIBRARY "{libm.as_posix()}" CACHE FILEPATH "")' in init
+
+    init = cc.write_init(tmp_path / 'new', R, 'abc', {'m': '/opt'}).read_text()
+    assert 'M_LIBRARY' not in init
+
+    # check results are per project
+    assert cc.write_init(tmp_path / 'new', tmp_path, 'abc', {}) is None
+
+
+def test_negative_not_seeded(tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'cache'))
+
+    # e.g. saved by an earlier buildmc version
+    cc.save(cc.get_store('abc', R), {'HAVE_NONEXIST_H': ('INTERNAL', ''), 'HAVE_FOO': ('INTERNAL', 'FALSE'),
+                                     'SIZEOF_LONG': ('INTERNAL', '8')})
+
+    init = cc.write_init(tmp_path / 'new', R, 'abc', {}).read_text()
+    assert 'set(SIZEOF_LONG "8" CACHE INTERNAL "")' in init
+    assert 'HAVE_NONEXIST_H' not in init
+    assert 'HAVE_FOO' not in init
+
+
+def test_concurrent_save(tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'cache'))
+
+    store = cc.get_store('abc')
+    store.parent.mkdir(parents=True)
+    store.write_text('{"HAVE_')  # truncated by an interrupted write
+    assert cc.load(store) == {}
+
+    def save(i: int):
+        cc.save(store, {f'HAVE_{i}_H': ('INTERNAL', '1')})
+        cc.write_init(tmp_path / f'b{i}', None, 'abc', {})
+
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(save, range(50)))
+
+    assert len(cc.load(store)) == 50
+    assert not list(store.parent.glob('*.tmp'))
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
@@ -13,7 +13,8 @@ VENDORS = ['gcc', 'clang', 'pgi', 'intel', 'cl']
 
 @pytest.mark.timeout(1800)
 @pytest.mark.parametrize('buildsys,vendor', [('cmake', v) for v in VENDORS] +
-                                            [('meson', v) for v in VENDORS])
+                                            [('meson', v) for v in VENDORS] +
+                                            [('make', v) for v in VENDORS])
 def test_builds(buildsys, vendor, tmp_path):
 
     if buildsys == 'cmake' and vendor == 'cl':
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+import pytest
+from pathlib import Path
+import subprocess
+import shutil
+import json
+import sys
+import os
+
+import buildmc.compileprof as compileprof
+from buildmc.mesonbuild import Meson
+from buildmc.gnumake import Make
+
+GCC_REPORT = """Time variable                                   usr           sys          wall           GGC
+ phase setup                        :   0.00 (  0%)   0.00 (  0%)   0.01 (  0%)  1326k ( 66%)
+ phase parsing                      :   0.40 ( 50%)   0.10 ( 10%)   0.50 ( 50%)   609k ( 30%)
+ phase opt and generate             :   0.30 (100%)   0.00 (  0%)   0.30 ( 30%)    79k (  4%)
+ template instantiation             :   0.20 ( 20%)   0.00 (  0%)   0.25 ( 25%)    79k (  4%)
+ TOTAL                              :   0.70          0.10          0.81         2016k
+"""
+
+
+def clang_trace(total, frontend, headers, templates):
+    ev = [{'ph': 'X', 'name': 'Total ExecuteCompiler', 'dur': total * 1e6},
+          {'ph': 'X', 'name': 'Total Frontend', 'dur': frontend * 1e6},
+          {'ph': 'X', 'name': 'Total Backend', 'dur': (total - frontend) * 1e6},
+          {'ph': 'M', 'name': 'process_name', 'args': {'name': 'clang'}}]
+    ev += [{'ph': 'X', 'name': 'Source', 'dur': t * 1e6, 'args': {'detail': h}} for h, t in headers.items()]
+    ev += [{'ph': 'X', 'name': 'InstantiateClass', 'dur': t * 1e6, 'args': {'detail': n}} for n, t in templates.items()]
+
+    return json.dumps({'traceEvents': ev})
+
+
+def test_clang(tmp_path):
+    obj = tmp_path / 'CMakeFiles' / 'a.dir'
+    obj.mkdir(parents=True)
+    (obj / 'a.cpp.json').write_text(clang_trace(2., 1.5, {'/usr/include/vector': 0.5}, {'std::vector<int>': 0.2}))
+    (obj / 'b.cpp.json').write_text(clang_trace(1., 0.5, {'/usr/include/vector': 0.4, 'b.h': 0.1}, {}))
+    (tmp_path / 'compile_commands.json').write_text('[]')
+
+    rep = compileprof.collect(tmp_path)
+    assert [u['file'] for u in rep['units']] == ['CMakeFiles/a.dir/a.cpp', 'CMakeFiles/a.dir/b.cpp']
+    assert rep['frontend'] == pytest.approx(2.)
+    assert rep['backend'] == pytest.approx(1.)
+    assert rep['headers'][0] == {'name': '/usr/include/vector', 'seconds': pytest.approx(0.9), 'count': 2}
+    assert rep['templates'][0]['name'] == 'std::vector<int>'
+
+    compileprof.report(tmp_path)
+    assert json.loads((tmp_path / 'buildmc_compile_profile.json').read_text())['seconds'] == pytest.approx(3.)
+    assert 'slowest translation units' in (tmp_path / 'buildmc_compile_profile.txt').read_text()
+
+
+def test_gcc(tmp_path):
+    (tmp_path / 'a.c.o.time-report.txt').write_text(GCC_REPORT)
+
+    rep = compileprof.collect(tmp_path)
+    u = rep['units'][0]
+    assert u['file'] == 'a.c.o'
+    assert u['seconds'] == pytest.approx(0.81)
+    assert u['frontend'] == pytest.approx(0.5)
+    assert u['backend'] == pytest.approx(0.3)
+    assert rep['templates'][0]['seconds'] == pytest.approx(0.25)
+
+
+@pytest.mark.skipif(os.name == 'nt' or not shutil.which('gcc'), reason='needs GCC and the launcher')
+def test_gcc_launcher(tmp_path):
+    src = tmp_path / 'a.c'
+    src.write_text('int main(void) { return 0; }')
+    launcher = Path(compileprof.__file__).with_name('launcher.py')
+
+    ret = subprocess.run([sys.executable, str(launcher), '-time_report', str(tmp_path / 'log.jsonl'),
+                          'gcc', '-c', str(src), '-o', str(tmp_path / 'a.c.o')],
+                         stderr=subprocess.PIPE, universal_newlines=True)
+    assert ret.returncode == 0
+    # only the time report, saved to a file
+    assert not ret.stderr
+    assert 'Time variable' in (tmp_path / 'a.c.o.time-report.txt').read_text()
+
+
+def test_gcc_backends(tmp_path):
+    params = {'build_dir': tmp_path, 'vendor': 'gcc', 'profile_compile': True}
+    try:
+        M = Meson(params)
+    except ImportError as e:
+        pytest.skip(str(e))
+
+    env = M.get_launcher_env()
+    if os.name != 'nt':
+        assert '-time_report' in env['CC'].split()
+
+    with pytest.raises(ValueError):
+        Make(params)
+
+
+if __name__ == '__main__':
+    pytest.main(['-x', __file__])
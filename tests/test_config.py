@@ -4,6 +4,7 @@ from pathlib import Path
 import pkg_resources as pr
 
 import buildmc.config as cfg
+from buildmc.compilers import profile_args
 from buildmc.cmake import Cmake
 
 R = Path(__file__).parent
@@ -41,6 +42,81 @@ def test_cmake_libargs():
     assert libargs[0] == '-DLAPACK_ROOT=~/nonexistent'
 
 
+def test_unity_size(tmp_path):
+    assert cfg.get_unity_size(tmp_path) is None
+
+    cfg.set_unity_size(8, tmp_path)
+    assert cfg.get_unity_size(tmp_path) == 8
+
+    (tmp_path / 'buildmc.ini').write_text('# tuned\n[buildmc]\nunity_size: 4\n')
+    cfg.set_unity_size(8, tmp_path)
+    assert (tmp_path / 'buildmc.ini').read_text() == '# tuned\n[buildmc]\nunity_size: 8\n'
+
+    C = Cmake({'source_dir': tmp_path, 'build_dir': tmp_path / 'build', 'unity': True})
+    if C.version < pr.parse_version('3.16'):
+        pytest.skip('CMake >= 3.16 required for unity build')
+    assert C.get_unity_args() == ['-DCMAKE_UNITY_BUILD=ON', '-DCMAKE_UNITY_BUILD_BATCH_SIZE=8']
+
+
+def test_set_option(tmp_path):
+    ini = tmp_path / 'buildmc.ini'
+    ini.write_text("""# my project
+[buildmc]
+compiler: gcc
+linker: lld
+library:
+  lapack ~/lapack
+# keep this
+
+[compiler_spec]
+CC: gcc-12
+""")
+
+    cfg.set_linker('mold', tmp_path)
+    cfg.set_option('buildmc', 'library', 'blas ~/blas', tmp_path)
+    cfg.set_option('compiler_spec', 'FC', 'gfortran', tmp_path)
+    cfg.set_option('profile.fast', 'lto', 'yes', tmp_path)
+
+    assert ini.read_text() == """# my project
+[buildmc]
+compiler: gcc
+linker: mold
+library: blas ~/blas
+# keep this
+
+[compiler_spec]
+CC: gcc-12
+FC: gfortran
+
+[profile.fast]
+lto: yes
+"""
+    assert cfg.get_linker(tmp_path) == 'mold'
+
+
+def test_profile(tmp_path):
+    assert cfg.get_profile('debug', tmp_path)['build_type'] == 'debug'
+
+    with pytest.raises(ValueError):
+        cfg.get_profile('fast', tmp_path)
+
+    (tmp_path / 'buildmc.ini').write_text('[profile.fast]\nnative: yes\nlto: yes\n')
+    fast = cfg.get_profile('fast', tmp_path)
+    assert fast['build_type'] == 'release'
+
+    args, flags = profile_args(fast, 'gnu', 'cmake')
+    assert args == ['-DCMAKE_BUILD_TYPE=Release', '-DCMAKE_INTERPROCEDURAL_OPTIMIZATION=ON']
+    assert flags['CFLAGS'] == '-O3 -march=native'
+
+    args, flags = profile_args(fast, 'intel', 'meson')
+    assert args == ['--buildtype=release', '-Doptimization=3', '-Db_lto=true']
+    assert '-xHost' in flags['FFLAGS'] or '/QxHost' in flags['FFLAGS']
+
+    args, flags = profile_args(cfg.get_profile('lto'), 'clang', 'make')
+    assert not args
+    assert flags['LDFLAGS'] == '-flto'
+
+
 def test_compiler_spec(tmp_path):
 
     assert cfg.get_compiler_spec(tmp_path) == {}
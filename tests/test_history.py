@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+import pytest
+from pathlib import Path
+import time
+
+import buildmc
+import buildmc.history as history
+from buildmc.builder import Builder
+
+R = Path(__file__).parent
+
+
+def test_history(tmp_path):
+    db = tmp_path / 'history.sqlite'
+    B = Builder({'source_dir': R, 'build_dir': tmp_path / 'build', 'vendor': 'gcc'})
+
+    assert history.get_runs(db=db) == []
+
+    for seconds in (10, 11, 9, 10, 13):
+        B.timings = {'build': seconds - 1., 'test': 1.}
+        history.record(B, 'ok', seconds, db)
+    history.record(B, 'fail', 1, db)
+    B.wipe_reason = 'wipe requested'
+    history.record(B, 'ok', 100, db, peak_rss=2**30)
+
+    runs = history.get_runs(R, db=db)
+    assert len(runs) == 7
+    assert runs[0]['phases'] == {'build': 9., 'test': 1.}
+    assert runs[0]['vendor'] == 'gnu'
+    assert runs[0]['peak_rss'] is None
+    assert runs[6]['peak_rss'] == 2**30
+
+    history.flag_regressions(runs, window=3, threshold=0.2)
+    assert runs[0]['baseline'] is None
+    assert runs[3]['baseline'] == 10
+    assert runs[4]['slower'] == pytest.approx(0.3)
+    assert not any(r['slower'] for r in runs[:4])
+    assert runs[5]['slower'] is None
+    # wiped builds are compared only with wiped builds
+    assert runs[6]['baseline'] is None
+
+    history.print_stats(runs)
+
+    assert history.get_runs(tmp_path, db=db) == []
+
+
+class Sleeper(Builder):
+
+    def config(self, wipe: bool = False):
+        if wipe:
+            self.log_wipe('wipe requested')
+        with self.phase('build'):
+            time.sleep(0.2)
+
+
+def test_run_twice(tmp_path):
+    db = tmp_path / 'history.sqlite'
+    B = Sleeper({'source_dir': R, 'build_dir': tmp_path / 'build', 'vendor': 'gcc', 'sample_interval': 0})
+
+    # e.g. unity.tune configures B before the build that is recorded
+    B.config(wipe=True)
+    buildmc.run(B, history_db=db)
+    buildmc.run(B, history_db=db)
+
+    runs = history.get_runs(R, db=db)
+    assert len(runs) == 2
+    for r in runs:
+        assert sum(r['phases'].values()) <= r['seconds']
+        assert not r['wipe_reason']
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
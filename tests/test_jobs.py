@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+import pytest
+import json
+
+import buildmc.jobs as jobs
+from buildmc.cmake import Cmake
+from buildmc.mesonbuild import Meson
+
+
+def test_parse_size():
+    assert jobs.parse_size('512M') == 512 * 2**20
+    assert jobs.parse_size('16G') == 16 * 2**30
+    assert jobs.parse_size('1.5GiB') == 3 * 2**29
+    assert jobs.parse_size('100') == 100
+
+    with pytest.raises(ValueError):
+        jobs.parse_size('lots')
+
+
+def test_meminfo(tmp_path):
+    fn = tmp_path / 'meminfo'
+    fn.write_text('MemTotal:        6158152 kB\nMemAvailable:    5702920 kB\nHugePages_Total:       0\n')
+
+    info = jobs.get_meminfo(fn)
+    assert info['MemAvailable'] == 5702920 * 1024
+    assert info['HugePages_Total'] == 0
+
+    assert jobs.get_meminfo(tmp_path / 'nonexistent') == {}
+
+
+def test_max_jobs(tmp_path):
+    assert jobs.max_jobs(8 * 2**30, 2**30, ncpu=64) == 8
+    assert jobs.max_jobs(8 * 2**30, 2**30, ncpu=4) == 4
+    assert jobs.max_jobs(2**20, 2**30, ncpu=4) == 1
+    assert jobs.max_jobs(0, 0, ncpu=4) == 4
+
+    log = tmp_path / jobs.LOG_NAME
+    assert jobs.peak_rss(log) == 0
+    log.write_text('\n'.join(json.dumps({'kind': 'compile', 'rss': r, 'seconds': 1.}) for r in (5, 7, 3)) + '\n{"kind"')
+    assert jobs.peak_rss(log) == 7
+
+
+def test_cmake_launcher(tmp_path):
+    C = Cmake({'build_dir': tmp_path, 'memory_budget': '1G'})
+    launcher = C.get_launcher_args()
+    if not launcher:
+        pytest.skip('compiler launcher not used on this platform')
+
+    assert 'launcher.py' in launcher[0]
+    assert C.get_jobs() == 1
+
+    # a launcher of the user is run by buildmc.launcher
+    C = Cmake({'build_dir': tmp_path, 'memory_budget': '1G'}, ['-DCMAKE_C_COMPILER_LAUNCHER:STRING=ccache'])
+    launcher = C.get_launcher_args()
+    assert launcher[0].endswith(f'{jobs.LOG_NAME};ccache')
+    assert not launcher[1].endswith('ccache')
+
+
+def test_cmake_launcher_env(tmp_path, monkeypatch):
+    monkeypatch.setenv('CMAKE_CXX_COMPILER_LAUNCHER', 'sccache')
+    C = Cmake({'build_dir': tmp_path, 'memory_budget': '1G'})
+    launcher = C.get_launcher_args()
+    if not launcher:
+        pytest.skip('compiler launcher not used on this platform')
+
+    assert launcher[1].startswith('-DCMAKE_CXX_COMPILER_LAUNCHER=')
+    assert launcher[1].endswith(';sccache')
+
+
+def test_trim_log(tmp_path):
+    log = tmp_path / jobs.LOG_NAME
+    log.write_text(''.join(json.dumps({'kind': 'compile', 'rss': r, 'seconds': 1.}) + '\n' for r in range(100)))
+
+    jobs.trim_log(log, 10)
+    assert log.read_text().count('\n') == 10
+    assert jobs.peak_rss(log) == 99
+    assert json.loads(log.read_text().splitlines()[0])['rss'] == 90
+
+    C = Cmake({'build_dir': tmp_path, 'memory_budget': '1G'})
+    C.log_wipe('compiler changed')
+    assert not log.exists()
+
+
+def test_meson_launcher(tmp_path):
+    try:
+        M = Meson({'build_dir': tmp_path, 'memory_budget': '1G'})
+    except ImportError as e:
+        pytest.skip(str(e))
+
+    env = M.get_launcher_env()
+    if not env:
+        pytest.skip('compiler launcher not used on this platform')
+
+    assert 'launcher.py' in env['CC']
+    assert env['CC'].endswith(' ' + M.compiler['CC'])
+
+    M.memory_budget = None
+    assert M.get_launcher_env() == {}
+
+    # the wrapper is set only by "meson setup"
+    intro = tmp_path / 'meson-info' / 'intro-compilers.json'
+    intro.parent.mkdir()
+    intro.write_text(json.dumps({'host': {'c': {'exelist': env['CC'].split()}}}))
+    assert M.check_launcher_cache()
+    M.memory_budget = '1G'
+    assert not M.check_launcher_cache()
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+import pytest
+import shutil
+import json
+
+import buildmc.compilers as compilers
+import buildmc.linker as linker
+from buildmc.cmake import Cmake
+
+
+def test_find_linker():
+    gcc = {'CC': 'gcc'}
+    assert compilers.find_linker(gcc, 'default') is None
+    assert compilers.find_linker({'CC': 'cl'}) is None
+    assert not compilers.probe_linker('gcc', 'nonexistent')
+
+
+@pytest.mark.skipif(not shutil.which('gcc') or not shutil.which('ld.gold'), reason='GCC and gold needed')
+def test_gold():
+    assert compilers.probe_linker('gcc', 'gold')
+    assert compilers.find_linker({'CC': 'gcc'}, 'gold') == 'gold'
+
+
+def test_read_links(tmp_path):
+    log = tmp_path / 'log.jsonl'
+    log.write_text(json.dumps({'kind': 'compile', 'rss': 1, 'seconds': 1., 'time': 5.}) + '\n')
+    with log.open('a') as f:
+        f.write(json.dumps({'kind': 'link', 'rss': 1, 'seconds': 2., 'output': 'z', 'time': 9.}) + '\n')
+        f.write(json.dumps({'kind': 'link', 'rss': 1, 'seconds': 2., 'output': 'a', 'time': 10.}) + '\n')
+        f.write(json.dumps({'kind': 'link', 'rss': 1, 'seconds': 3., 'output': 'b', 'time': 11.}) + '\n')
+
+    assert len(linker.read_links(log)) == 3
+    assert [r['output'] for r in linker.read_links(log, 10.)] == ['a', 'b']
+
+
+def test_fastest():
+    links = {'default': [{'seconds': 2.}], 'lld': [], 'gold': [{'seconds': 1.}, {'seconds': 0.5}]}
+    assert linker.fastest(links) == 'gold'
+
+    # a linker that did not link is not the fastest
+    links['gold'] = [{'seconds': 3.}]
+    assert linker.fastest(links) == 'default'
+
+    with pytest.raises(ValueError):
+        linker.fastest({'default': [], 'lld': []})
+
+
+def test_unset_launcher(tmp_path):
+    """
+    the link time launcher of -linker_compare is removed from the CMake cache by the next configure
+    """
+    C = Cmake({'build_dir': tmp_path})
+    C.time_links = True
+    launcher = [a for a in C.get_launcher_args() if a.startswith('-DCMAKE_C_LINKER_LAUNCHER=')]
+    if not launcher:
+        pytest.skip('linker launcher not used on this platform or CMake version')
+
+    C.time_links = False
+    assert not [a for a in C.get_launcher_args() if 'LINKER_LAUNCHER' in a]
+
+    (tmp_path / 'CMakeCache.txt').write_text(launcher[0][2:].replace('=', ':STRING=', 1) + '\n')
+    assert '-DCMAKE_C_LINKER_LAUNCHER=' in C.get_launcher_args()
+
+
+if __name__ == '__main__':
+    pytest.main(['-x', __file__])
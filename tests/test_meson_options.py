@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+import pytest
+from pathlib import Path
+
+from buildmc.mesonbuild import Meson
+
+CURRENT = [{'name': 'full', 'value': False, 'section': 'user', 'type': 'boolean'},
+           {'name': 'buildtype', 'value': 'debug', 'section': 'core', 'type': 'combo'},
+           {'name': 'unity_size', 'value': 4, 'section': 'core', 'type': 'integer'},
+           {'name': 'c_args', 'value': ['-g', '-Wall'], 'section': 'compiler', 'type': 'array'},
+           {'name': 'werror', 'value': False, 'section': 'core', 'type': 'boolean'},
+           {'name': 'prefix', 'value': str(Path.home() / 'lib'), 'section': 'directory', 'type': 'string'}]
+
+
+def test_parse_options():
+    args = ['-Dfull=true', '--buildtype=release', '--prefix', '/opt/x', '--werror', '--default-library', 'static']
+
+    assert Meson.parse_options(args) == {'full': 'true', 'buildtype': 'release', 'prefix': '/opt/x',
+                                         'werror': 'true', 'default_library': 'static'}
+
+
+def test_diff_options():
+    same = {'full': 'false', 'buildtype': 'debug', 'unity_size': '4', 'c_args': '-g,-Wall', 'prefix': '~/lib'}
+    assert Meson.diff_options(CURRENT, same) == {}
+
+    changed = {'full': 'true', 'unity_size': '8', 'c_args': "['-g']", 'prefix': '/opt/x', 'werror': 'true',
+               'nonexistent': 'foo'}
+    assert Meson.diff_options(CURRENT, changed) == {'full': 'true', 'unity_size': '8', 'c_args': "['-g']",
+                                                    'prefix': '/opt/x', 'werror': 'true'}
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
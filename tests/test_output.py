@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+import pytest
+import subprocess
+import gzip
+import sys
+
+from buildmc.output import Runner
+import buildmc.output as output
+
+PRINT = [sys.executable, '-c', 'import sys; [print(i) for i in range(5)]; sys.exit(int(sys.argv[1]))']
+
+
+def test_prefix(capsys):
+    R = Runner('proj')
+    assert R.run(PRINT + ['0']).returncode == 0
+    assert capsys.readouterr().out.splitlines() == [f'[proj] {i}' for i in range(5)]
+
+
+def test_quiet(capsys, tmp_path):
+    R = Runner('proj', quiet=True, log_dir=tmp_path, tail=2)
+    R.check_call(PRINT + ['0'])
+    assert capsys.readouterr().out == ''
+
+    with pytest.raises(subprocess.CalledProcessError):
+        R.check_call(PRINT + ['1'])
+    out = capsys.readouterr().out.splitlines()
+    assert out[1:] == ['[proj] 3', '[proj] 4']
+
+    fn = tmp_path / f'proj-{output.RUN_ID}.log.gz'
+    with gzip.open(fn, 'rt') as f:
+        log = f.read().splitlines()
+    assert len(log) == 12
+
+    # later builders of the same run append, e.g. the two builds of PGO
+    Runner('proj', quiet=True, log_dir=tmp_path).check_call(PRINT + ['0'])
+    with gzip.open(fn, 'rt') as f:
+        assert len(f.read().splitlines()) == 18
+    assert len(list(tmp_path.iterdir())) == 1
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+import pytest
+from pathlib import Path
+import subprocess
+import shutil
+import os
+
+import buildmc
+import buildmc.compilers as comp
+import buildmc.pgo as pgo
+from buildmc.fingerprint import source_fingerprint
+
+
+@pytest.mark.parametrize('cc,vendor', [('gcc', 'gnu'), ('clang', 'clang'), ('icc', 'intel'),
+                                       ('cl', 'msvc'), ('clang-cl', 'clangcl'), ('pgcc', 'pgi')])
+def test_vendor(cc, vendor):
+    assert comp.get_vendor({'CC': cc}) == vendor
+
+
+def test_pgo_flags(tmp_path):
+    gen = comp.pgo_flags('gnu', 'generate', tmp_path / 'raw', tmp_path)
+    assert f'-fprofile-generate={tmp_path / "raw"}' in gen['CFLAGS'].split()
+    assert gen['LDFLAGS'] == gen['CFLAGS']
+    assert f'-fprofile-prefix-path={tmp_path}' in gen['CFLAGS'].split()
+    # GCC < 11: same build directory for both phases
+    assert '-fprofile-prefix-path' not in comp.pgo_flags('gnu', 'use', tmp_path / 'raw')['CFLAGS']
+
+    use = comp.pgo_flags('clang', 'use', tmp_path / 'a.profdata', tmp_path)
+    assert f'-fprofile-instr-use={tmp_path / "a.profdata"}' in use['CXXFLAGS'].split()
+
+    with pytest.raises(ValueError):
+        comp.pgo_flags('msvc', 'use', tmp_path, tmp_path)
+
+    compiler = {'CC': 'gcc', 'CFLAGS': '-g'}
+    comp.add_flags(compiler, {'CFLAGS': '-O3'})
+    assert compiler['CFLAGS'] == '-g -O3'
+
+
+@pytest.mark.skipif(os.name == 'nt', reason='executable scripts')
+def test_icx_pgo(tmp_path):
+    assert comp.pgo_vendor({'CC': 'icx'}) == 'clang'
+    assert comp.pgo_vendor({'CC': 'icc'}) == 'intel'
+    assert comp.pgo_vendor({'CC': 'gcc'}) == 'gnu'
+
+    # oneAPI layout: bin/icx with its own bin/compiler/llvm-profdata
+    (tmp_path / 'bin' / 'compiler').mkdir(parents=True)
+    for exe in ('bin/icx', 'bin/compiler/llvm-profdata'):
+        (tmp_path / exe).write_text('#!/bin/sh\n')
+        (tmp_path / exe).chmod(0o755)
+
+    found = pgo.find_profdata('icx', {'PATH': str(tmp_path / 'bin')})
+    assert Path(found) == tmp_path / 'bin' / 'compiler' / 'llvm-profdata'
+
+
+def test_gcc_major():
+    assert comp.gcc_major('nonexistent-gcc') == 0
+    if shutil.which('gcc'):
+        assert comp.gcc_major('gcc') >= 4
+
+
+def test_fingerprint(tmp_path):
+    src = tmp_path / 'src'
+    (src / 'build').mkdir(parents=True)
+    (src / 'a.c').write_text('int a;')
+
+    fp = source_fingerprint(src, exclude=src / 'build')
+    (src / 'build' / 'a.o').write_text('object')
+    assert source_fingerprint(src, exclude=src / 'build') == fp
+
+    (src / 'b.c').write_text('int b;')
+    assert source_fingerprint(src, exclude=src / 'build') != fp
+
+    assert source_fingerprint(Path(__file__).parent)
+
+
+@pytest.mark.skipif(not shutil.which('git'), reason='needs Git')
+def test_git_fingerprint(tmp_path):
+    src = tmp_path / 'src'
+    src.mkdir()
+    (src / 'a.c').write_text('int a;')
+    (src / '.gitignore').write_text('*.o\n')
+    git = ['git', '-C', str(src), '-c', 'user.name=t', '-c', 'user.email=t@t']
+    subprocess.check_call(git + ['init', '-q'])
+    subprocess.check_call(git + ['add', '.'])
+    subprocess.check_call(git + ['commit', '-q', '-m', 'init'])
+
+    fp = source_fingerprint(src, exclude=src / 'build')
+    (src / 'a.o').write_text('object')
+    (src / 'build').mkdir()
+    (src / 'build' / 'CMakeCache.txt').write_text('')
+    assert source_fingerprint(src, exclude=src / 'build') == fp
+
+    # untracked files are sources too
+    (src / 'b.c').write_text('int b;')
+    fp2 = source_fingerprint(src, exclude=src / 'build')
+    assert fp2 != fp
+    (src / 'b.c').write_text('int b = 1;')
+    assert source_fingerprint(src, exclude=src / 'build') != fp2
+
+
+@pytest.mark.skipif(not shutil.which('cmake') or not shutil.which('gcc'), reason='needs CMake and GCC')
+def test_pgo_profile(tmp_path, monkeypatch):
+    builds = []
+
+    def fake_run(B, wipe=False, history_db=None):
+        B.build_dir.mkdir(parents=True, exist_ok=True)
+        builds.append(B)
+
+    monkeypatch.setattr(buildmc, 'run', fake_run)
+    monkeypatch.setattr(pgo, 'merge', lambda *args, **kwargs: None)
+
+    params = {'source_dir': Path(__file__).parent, 'build_dir': tmp_path / 'build', 'vendor': 'gcc',
+              'build_system': 'cmake'}
+    buildmc.do_pgo(params)
+
+    # without -profile, the instrumented and optimized builds are optimized release builds
+    assert len(builds) == 2
+    for B in builds:
+        assert B.profile == 'release'
+        assert '-DCMAKE_BUILD_TYPE=Release' in B.args
+        assert '-O3' in B.compiler['CFLAGS'].split()
+    assert any(f.startswith('-fprofile-use') for f in builds[1].compiler['CFLAGS'].split())
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
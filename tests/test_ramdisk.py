@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+import pytest
+import os
+
+import buildmc.ramdisk as ramdisk
+
+
+@pytest.mark.skipif(os.name == 'nt', reason='symlinks need privileges on Windows')
+def test_ramdisk(tmp_path):
+    root = tmp_path / 'ram'
+    src = tmp_path / 'proj'
+    build_dir = src / 'build'
+
+    ram_dir = ramdisk.setup(build_dir, src, root)
+    assert build_dir.resolve() == ram_dir.resolve()
+    assert ram_dir.parent == root
+    # same directory next time, and a different one for another build directory
+    assert ramdisk.setup(build_dir, src, root) == ram_dir
+    assert ramdisk.setup(src / 'build2', src, root) != ram_dir
+
+    (ram_dir / 'lib').mkdir()
+    (ram_dir / 'lib' / 'libfoo.a').write_text('foo')
+    (ram_dir / 'main.o').write_text('obj')
+    dest = src / 'build-artifacts'
+    assert ramdisk.sync(ram_dir, dest, ['lib/*.a']) == 1
+    assert (dest / 'lib' / 'libfoo.a').read_text() == 'foo'
+    assert not (dest / 'main.o').exists()
+    assert ramdisk.sync(ram_dir, dest, ['lib/*.a']) == 0
+
+
+def test_existing_build_dir(tmp_path):
+    build_dir = tmp_path / 'build'
+    build_dir.mkdir()
+    (build_dir / 'CMakeCache.txt').touch()
+
+    with pytest.raises(FileExistsError):
+        ramdisk.setup(build_dir, tmp_path, tmp_path / 'ram')
+
+
+if __name__ == '__main__':
+    pytest.main(['-x', __file__])
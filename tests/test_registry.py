@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+import pytest
+
+import buildmc.registry as registry
+from buildmc.builder import Builder
+
+
+def test_gc(tmp_path):
+    db = tmp_path / 'history.sqlite'
+    src = tmp_path / 'src'
+    src.mkdir()
+
+    for i, name in enumerate(('old', 'mid', 'new')):
+        build_dir = tmp_path / name
+        build_dir.mkdir()
+        (build_dir / 'CMakeCache.txt').write_text('x')
+        (build_dir / 'big.o').write_bytes(b'0' * 100000)
+        registry.register(Builder({'source_dir': src, 'build_dir': build_dir, 'vendor': 'gcc'}), db)
+        with registry.connect(db) as conn:
+            conn.execute('UPDATE build_dirs SET last_used = ? WHERE build_dir = ?', (i, str(build_dir)))
+        conn.close()
+
+    # the source directory is never removed
+    registry.register(Builder({'source_dir': src, 'build_dir': src, 'vendor': 'gcc'}), db)
+
+    dirs = registry.get_dirs(db)
+    assert [d['build_dir'] for d in dirs[:3]] == [str(tmp_path / n) for n in ('old', 'mid', 'new')]
+    size = dirs[0]['size']
+    assert size >= 100000
+    assert dirs[0]['compiler']['CC'] == 'gcc'
+
+    assert [d['build_dir'] for d in registry.gc(int(2.5 * size), db, dry_run=True)] == [str(tmp_path / 'old')]
+    assert (tmp_path / 'old').is_dir()
+
+    registry.gc(int(1.5 * size), db)
+    assert not (tmp_path / 'old').exists()
+    assert not (tmp_path / 'mid').exists()
+    assert (tmp_path / 'new').is_dir()
+    assert src.is_dir()
+    assert len(registry.get_dirs(db)) == 2
+
+
+def test_gc_nested(tmp_path):
+    """
+    a build profile directory inside an older build directory is kept, and not counted twice
+    """
+    db = tmp_path / 'history.sqlite'
+    src = tmp_path / 'src'
+    src.mkdir()
+    build_dir = tmp_path / 'build'
+
+    for i, path in enumerate((build_dir, build_dir / 'release')):
+        path.mkdir()
+        (path / 'CMakeCache.txt').write_text('x')
+        (path / 'big.o').write_bytes(b'0' * 100000)
+        registry.register(Builder({'source_dir': src, 'build_dir': path, 'vendor': 'gcc'}), db)
+        with registry.connect(db) as conn:
+            conn.execute('UPDATE build_dirs SET last_used = ? WHERE build_dir = ?', (i, str(path)))
+        conn.close()
+
+    dirs = registry.get_dirs(db)
+    assert dirs[0]['size'] < 2 * 100000
+    assert sum(d['size'] for d in dirs) < 3 * 100000
+
+    assert [d['build_dir'] for d in registry.gc(150000, db)] == [str(build_dir)]
+    assert not (build_dir / 'big.o').exists()
+    assert (build_dir / 'release' / 'big.o').is_file()
+    assert [d['build_dir'] for d in registry.get_dirs(db)] == [str(build_dir / 'release')]
+
+
+if __name__ == '__main__':
+    pytest.main(['-x', __file__])
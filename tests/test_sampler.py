@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+import pytest
+import subprocess
+import sys
+
+import buildmc.sampler as sampler
+
+
+def test_summarize():
+    samples = [{'t': 1., 'phase': 'configure', 'cpu': 1., 'cores': 1., 'rss': 10, 'compilers': 0,
+                'read': 0, 'write': 0},
+               {'t': 2., 'phase': 'build', 'cpu': 5., 'cores': 4., 'rss': 50, 'compilers': 4,
+                'read': 0, 'write': 100},
+               {'t': 3., 'phase': 'build', 'cpu': 6., 'cores': 1., 'rss': 20, 'compilers': 1,
+                'read': 0, 'write': 200},
+               {'t': 4., 'phase': 'build', 'cpu': 7., 'cores': 1., 'rss': 20, 'compilers': 0,
+                'read': 0, 'write': 300}]
+
+    S = sampler.summarize(samples, ncpu=4)
+
+    assert S['utilization'] == pytest.approx(7 / 4 / 4)
+    assert S['phases']['build']['utilization'] == pytest.approx(6 / 3 / 4)
+    assert S['idle_tail'] == pytest.approx(2.)
+    assert S['peak_rss'] == 50
+    assert S['max_compilers'] == 4
+    assert S['write'] == 300
+
+
+@pytest.mark.skipif(not sampler.Sampler.available(), reason='Linux /proc needed')
+def test_sampler(tmp_path):
+    S = sampler.Sampler(0.05, lambda: 'build')
+    S.start()
+    subprocess.run([sys.executable, '-c', 'import time; t = time.time()\nwhile time.time() - t < 0.5: pass'])
+    S.stop()
+
+    assert S.samples
+    assert all(s['phase'] == 'build' for s in S.samples)
+    assert S.samples[-1]['cpu'] > 0.2
+    assert max(s['rss'] for s in S.samples) > 0
+
+    S.write(tmp_path / sampler.TIMELINE_NAME)
+    assert len((tmp_path / sampler.TIMELINE_NAME).read_text().splitlines()) == len(S.samples)
+
+
+if __name__ == '__main__':
+    pytest.main(['-x', __file__])
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+import pytest
+import shutil
+import os
+
+import buildmc.vendorenv as vendorenv
+
+SETVARS = """
+export FAKE_ROOT=/opt/fake
+export PATH=/opt/fake/bin:$PATH
+export CPATH=/opt/fake/include${CPATH:+:$CPATH}
+"""
+
+
+def test_diff():
+    sep = os.pathsep
+    before = {'PATH': 'a', 'MANPATH': 'm', 'HOME': 'h'}
+    after = {'PATH': sep.join(('x', 'a')), 'MANPATH': sep.join(('m', 'y')), 'HOME': 'h', 'FOO': '1',
+             'LD_LIBRARY_PATH': 'z' + sep}
+    diff = vendorenv.env_diff(before, after)
+    assert diff == {'set': {'FOO': '1'}, 'prepend': {'PATH': 'x' + sep, 'LD_LIBRARY_PATH': 'z' + sep},
+                    'append': {'MANPATH': sep + 'y'}}
+
+    env = vendorenv.apply(diff, {'PATH': 'b', 'LD_LIBRARY_PATH': 'l'})
+    assert env == {'FOO': '1', 'PATH': sep.join(('x', 'b')), 'LD_LIBRARY_PATH': sep.join(('z', 'l')),
+                   'MANPATH': 'y'}
+
+
+@pytest.mark.skipif(os.name == 'nt' or not shutil.which('bash'), reason='needs bash')
+def test_activate(tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'cache'))
+    monkeypatch.delenv('CPATH', raising=False)
+    for v in vendorenv.ACTIVE['intel']:
+        monkeypatch.delenv(v, raising=False)
+
+    script = tmp_path / 'setvars.sh'
+    script.write_text(SETVARS)
+    cfg = tmp_path / 'buildmc.ini'
+    cfg.write_text(f'[buildmc]\nintel_env: {script}\n')
+
+    env = vendorenv.activate('intel', cfg)
+    assert env['FAKE_ROOT'] == '/opt/fake'
+    assert env['PATH'] == '/opt/fake/bin' + os.pathsep + os.environ['PATH']
+    assert env['CPATH'] == '/opt/fake/include'
+    assert 'SHLVL' not in env
+
+    # cached: the script is not sourced again, and path lists apply to the current environment
+    monkeypatch.setattr(vendorenv, 'capture', None)
+    monkeypatch.setenv('CPATH', '/usr/local/include')
+    env = vendorenv.activate('intel', cfg)
+    assert env['CPATH'] == '/opt/fake/include' + os.pathsep + '/usr/local/include'
+
+    # sourced again when the script changes
+    monkeypatch.undo()
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'cache'))
+    for v in vendorenv.ACTIVE['intel']:
+        monkeypatch.delenv(v, raising=False)
+    script.write_text(SETVARS.replace('/opt/fake', '/opt/fake2'))
+    os.utime(script, ns=(script.stat().st_atime_ns, script.stat().st_mtime_ns + 10**9))
+    assert vendorenv.activate('intel', cfg)['FAKE_ROOT'] == '/opt/fake2'
+
+    # already active
+    monkeypatch.setenv('SETVARS_COMPLETED', '1')
+    assert vendorenv.activate('intel', cfg) == {}
+    assert vendorenv.activate('gnu', cfg) == {}
@@ -8,6 +8,7 @@ import tempfile
 
 from buildmc.cmake import Cmake
 from buildmc.mesonbuild import Meson
+from buildmc.gnumake import Make
 from buildmc.compilers import get_compiler
 
 R = Path(__file__).parent
@@ -48,11 +49,31 @@ def test_cmake_blank(vendor, dir_gen):
 
     if first_cmake:
         assert not C.needs_wipe(False)
+        C.generate()
         first_cmake = False
     else:
         assert C.needs_wipe(False)
 
 
+def test_cmake_configure_once(tmp_path):
+    params = {'build_dir': tmp_path, 'source_dir': R}
+    C = Cmake(params)
+    assert C.needs_generate()
+    C.generate()
+
+    C = Cmake(params)
+    assert not C.needs_generate()
+
+    C = Cmake(params, ['-Dfull=OFF'])
+    assert not C.needs_generate()
+
+    C = Cmake(params, ['-Dfull=on'])
+    assert C.needs_generate()
+
+    C = Cmake(dict(params, install_dir=tmp_path / 'install'))
+    assert C.needs_generate()
+
+
 def test_meson_empty(tmp_path):
     build_dir = tmp_path
     params = {'build_dir': build_dir, 'source_dir': R}
@@ -83,5 +104,35 @@ def test_meson_blank(vendor, dir_gen):
         M.config(True)
 
 
+def test_make_stamp(tmp_path):
+    params = {'build_dir': tmp_path, 'source_dir': R}
+    G = Make(params)
+
+    assert not G.needs_wipe(False)
+    assert G.needs_wipe(True)
+
+    G.config(False)
+    assert not G.needs_wipe(False)
+
+    G.compiler['CC'] = 'nonexistent_cc'
+    assert G.needs_wipe(False)
+
+
+def test_flags_stamp(tmp_path):
+    """
+    a build directory is wiped when its compiler flags change, e.g. by a build profile
+    """
+    C = Cmake({'build_dir': tmp_path, 'source_dir': R})
+    C.compiler['CFLAGS'] = '-O1'
+    assert not C.flags_changed()
+
+    C.save_flags()
+    assert not C.flags_changed()
+
+    C.compiler['CFLAGS'] = '-O3 -march=native'
+    assert C.flags_changed()
+    assert 'flags changed' in C.wipe_reason
+
+
 if __name__ == '__main__':
     pytest.main([__file__])